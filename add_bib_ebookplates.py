@@ -70,8 +70,9 @@ def needs_bookplate_update(
 ) -> bool:
     """Check if a 966 field matches the SPAC code, but needs an update to URL or name."""
     # First, match on subfield a. If no match, this field doesn't need updating.
-    # get_subfields returns a list, we expect only one $a,b,c per 966 field
-    if spac_code != old_field.get_subfields("a")[0]:
+    # get_subfields returns a list, we expect only one $a,b,c per 966 field;
+    # a 966 without $a (or $b, below) compares as None instead of raising IndexError
+    if spac_code != next(iter(old_field.get_subfields("a")), None):
         return False
     # If the new URL is an empty string, check if $c exists. If it does, update is needed.
     elif (not spac_url) and (old_field.get_subfields("c")):
@@ -85,7 +86,7 @@ def needs_bookplate_update(
         if spac_url != old_field.get_subfields("c")[0]:
             return True
     # Now check if the bookplate text needs updating
-    if spac_name != old_field.get_subfields("b")[0]:
+    if spac_name != next(iter(old_field.get_subfields("b")), None):
         return True
 
 
@@ -1,5 +1,6 @@
 import json
 import xmltodict
+from typing import Iterator
 from alma_api_client import AlmaAPIClient
 
 
@@ -76,6 +77,14 @@ class AlmaAnalyticsClient:
 
     def get_report(self) -> list[dict]:
         """Run Analytics report and return data."""
+        return list(self.get_report_iter())
+
+    def get_report_iter(self) -> Iterator[dict]:
+        """Run Analytics report and yield its rows as each page is fetched.
+
+        Lets callers start on the first rows before the whole report is retrieved,
+        without holding every row in memory.
+        """
         if self.report_path is None:
             raise ValueError("Path to report must be set")
         # Used with every API call
@@ -92,11 +101,12 @@ class AlmaAnalyticsClient:
         report = self.alma_client.get_analytics_report(params)
         # Get data in usable format
         report_data = self._get_report_data(report)
-        # Initial set of rows
-        all_rows = self._get_rows(report_data)
 
         # Preserve column_names as they don't seem to be set on subsequent runs
         column_names = report_data["column_names"]
+        # Initial set of rows, with generic column names replaced by real ones
+        yield from self._apply_column_names(column_names, self._get_rows(report_data))
+
         # Use the token from first run in all subsequent ones
         subsequent_params = {
             "token": report_data["resumption_token"],
@@ -107,11 +117,9 @@ class AlmaAnalyticsClient:
             params = constant_params | subsequent_params
             report = self.alma_client.get_analytics_report(params)
             report_data = self._get_report_data(report)
-            all_rows.extend(self._get_rows(report_data))
-
-        # Replace generic column names with real ones
-        final_data = self._apply_column_names(column_names, all_rows)
-        return final_data
+            yield from self._apply_column_names(
+                column_names, self._get_rows(report_data)
+            )
 
     def _get_report_data(self, xml_report: dict) -> dict:
         """Return usable data from XML the Analytics API uses."""
@@ -1,11 +1,80 @@
+import logging
+import random
 import requests
-from time import sleep
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from urllib3.util.retry import Retry
+from collections import deque
+from threading import Lock
+from time import monotonic, sleep
+from typing import Optional
+
+
+class SlidingWindowRateLimiter:
+    """Allow at most max_calls in any rolling window of window_seconds.
+
+    Call acquire() before each API call; it blocks until the call is allowed.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_calls: int, window_seconds: float = 1) -> None:
+        self.max_calls = max_calls
+        self.window_seconds = window_seconds
+        self._call_times: deque = deque()
+        self._lock = Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = monotonic()
+            # forget calls which have left the window
+            while self._call_times and now - self._call_times[0] >= self.window_seconds:
+                self._call_times.popleft()
+            if len(self._call_times) >= self.max_calls:
+                # wait for the oldest call in the window to expire
+                sleep(self.window_seconds - (now - self._call_times.popleft()))
+                now = monotonic()
+            self._call_times.append(now)
+
+
+# Alma allows 25 API calls per second per institution
+DEFAULT_REQUESTS_PER_MINUTE = 1500
+
+
+def get_rate_limiter(requests_per_minute: int) -> SlidingWindowRateLimiter:
+    """Return a rate limiter allowing requests_per_minute Alma API calls.
+
+    Calls are spaced evenly through the minute, so they can't burst past Alma's
+    per-second limit.
+    """
+    return SlidingWindowRateLimiter(1, window_seconds=60 / requests_per_minute)
 
 
 class AlmaAPIClient:
-    def __init__(self, api_key: str) -> None:
+    def __init__(self, api_key: str, pool_maxsize: int = 16) -> None:
         self.API_KEY = api_key
         self.BASE_URL = "https://api-na.hosted.exlibrisgroup.com"
+        self.session = self._get_session(pool_maxsize)
+
+    def _get_session(self, pool_maxsize: int) -> requests.Session:
+        """Return a session which reuses connections (keep-alive) across API calls.
+
+        pool_maxsize should be at least the number of threads sharing the client;
+        otherwise extra connections are opened and then discarded.
+        Transient server errors from Alma are retried with backoff. Rate limiting
+        (429) is not retried here; callers retry it with call_with_retry, so every
+        retry also goes through their rate limiter.
+        """
+        retries = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[500, 502, 503, 504],
+            # return the final error response, as callers check its content
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retries)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        return session
 
     def _get_headers(self, format: str = "json") -> dict:
         return {
@@ -43,7 +112,7 @@ class AlmaAPIClient:
             parameters = {}
         get_url = self.BASE_URL + api
         headers = self._get_headers(format)
-        response = requests.get(get_url, headers=headers, params=parameters)
+        response = self.session.get(get_url, headers=headers, params=parameters)
         api_data: dict = self._get_api_data(response, format)
         return api_data
 
@@ -55,7 +124,7 @@ class AlmaAPIClient:
         post_url = self.BASE_URL + api
         headers = self._get_headers(format)
         # TODO: Non-JSON POST?
-        response = requests.post(
+        response = self.session.post(
             post_url, headers=headers, json=data, params=parameters
         )
         api_data: dict = self._get_api_data(response, format)
@@ -70,12 +139,12 @@ class AlmaAPIClient:
         put_url = self.BASE_URL + api
         # Handle both XML (required by update_bib) and default JSON
         if format == "xml":
-            response = requests.put(
+            response = self.session.put(
                 put_url, headers=headers, data=data, params=parameters
             )
         else:
             # json default
-            response = requests.put(
+            response = self.session.put(
                 put_url, headers=headers, json=data, params=parameters
             )
         api_data: dict = self._get_api_data(response, format)
@@ -88,7 +157,7 @@ class AlmaAPIClient:
             parameters = {}
         delete_url = self.BASE_URL + api
         headers = self._get_headers(format)
-        response = requests.delete(delete_url, headers=headers, params=parameters)
+        response = self.session.delete(delete_url, headers=headers, params=parameters)
         # Success is HTTP 204, "No Content"
         if response.status_code != 204:
             # TODO: Real error handling
@@ -330,3 +399,50 @@ class AlmaAPIClient:
             parameters = {}
         api = f"/almaws/v1/acq/funds/{fund_id}"
         return self._call_put_api(api, fund, parameters)
+
+
+class AlmaRateLimitError(Exception):
+    """Raised when Alma responds with HTTP 429, so the call can be retried."""
+
+
+# connection problems and rate limiting are retried; anything else is a real error
+RETRY_EXCEPTIONS = (ConnectionError, Timeout, AlmaRateLimitError)
+
+
+def _call_checking_rate_limit(
+    api_method, rate_limiter: Optional[SlidingWindowRateLimiter], *args
+) -> dict:
+    if rate_limiter:
+        rate_limiter.acquire()
+    api_data = api_method(*args)
+    api_response = api_data.get("api_response", {})
+    if api_response.get("status_code") == 429:
+        # wait as long as Alma asks before the retry's own backoff
+        retry_after = api_response["headers"].get("Retry-After", "")
+        if retry_after.isdigit():
+            sleep(int(retry_after))
+        raise AlmaRateLimitError(f"Rate limited calling {api_response['request_url']}")
+    return api_data
+
+
+def call_with_retry(
+    api_method, *args, rate_limiter: SlidingWindowRateLimiter = None
+) -> dict:
+    """Call an AlmaAPIClient method, retrying connection errors and rate limiting.
+
+    Backoff is exponential, and every wait (including the first) is a random time
+    between half and all of it, so retries after an Alma outage are spread out
+    rather than all arriving at once.
+    If a rate_limiter is given, every attempt waits for it first.
+    """
+    tries, delay, max_delay, backoff = 3, 20, 120, 2
+    for attempt in range(tries):
+        try:
+            return _call_checking_rate_limit(api_method, rate_limiter, *args)
+        except RETRY_EXCEPTIONS as e:
+            if attempt == tries - 1:
+                raise
+            max_wait = min(delay * backoff**attempt, max_delay)
+            wait_seconds = random.uniform(max_wait / 2, max_wait)
+            logging.warning("%s, retrying in %.1f seconds...", e, wait_seconds)
+            sleep(wait_seconds)
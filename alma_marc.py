@@ -1,6 +1,7 @@
 import xml.etree.ElementTree as ET
-from pymarc import parse_xml_to_array, record_to_xml_node, Record
+from pymarc import parse_xml_to_array, record_to_xml_node, Field, Record, Subfield
 from io import BytesIO
+from typing import Callable
 
 
 def get_pymarc_record_from_bib(alma_bib: bytes) -> Record:
@@ -34,3 +35,48 @@ def prepare_bib_for_update(original_bib: bytes, new_record: Record) -> bytes:
         bib_element, encoding="utf8", method="xml", xml_declaration=False
     )
     return bib_xml
+
+
+def get_pymarc_field_from_datafield(datafield: ET.Element) -> Field:
+    """Takes a MARCXML <datafield> element and returns it as a pymarc Field."""
+    return Field(
+        tag=datafield.get("tag"),
+        indicators=[datafield.get("ind1", " "), datafield.get("ind2", " ")],
+        subfields=[
+            Subfield(code=subfield.get("code"), value=subfield.text or "")
+            for subfield in datafield.findall("subfield")
+        ],
+    )
+
+
+def remove_fields_from_bib(
+    alma_bib: bytes, removal_checks: dict[str, Callable[[Field], bool]]
+) -> tuple[bytes, list[Field]]:
+    """Takes an Alma Bib and removes datafields from its <record> element,
+    without converting the whole record to pymarc.
+
+    removal_checks maps a tag to a function which takes a pymarc Field and returns
+    True if the field should be removed. Only datafields with those tags are
+    converted to pymarc. Returns the updated Bib bytestring and the removed fields;
+    if no fields were removed, the original Bib is returned unchanged.
+    """
+    bib_element = ET.fromstring(alma_bib)
+    record_element = bib_element.find("record")
+
+    removed_fields = []
+    for datafield in record_element.findall("datafield"):
+        needs_removal = removal_checks.get(datafield.get("tag"))
+        if needs_removal is None:
+            continue
+        field = get_pymarc_field_from_datafield(datafield)
+        if needs_removal(field):
+            record_element.remove(datafield)
+            removed_fields.append(field)
+
+    if not removed_fields:
+        return alma_bib, removed_fields
+    # xml_declaration=False, as in prepare_bib_for_update
+    bib_xml = ET.tostring(
+        bib_element, encoding="utf8", method="xml", xml_declaration=False
+    )
+    return bib_xml, removed_fields
@@ -1,21 +1,124 @@
 import argparse
+import atexit
+import csv
 import logging
+import queue
+import re
+import sqlite3
 from alma_api_keys import API_KEYS
 from alma_api_client import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    RETRY_EXCEPTIONS,
     AlmaAPIClient,
-    get_pymarc_record_from_bib,
-    prepare_bib_for_update,
-    AlmaAnalyticsClient,
+    SlidingWindowRateLimiter,
+    call_with_retry,
+    get_rate_limiter,
 )
+from alma_analytics_client import AlmaAnalyticsClient
+from alma_marc import remove_fields_from_bib
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging.handlers import QueueHandler, QueueListener
 from pymarc import Field
 from datetime import datetime
-from retry.api import retry_call
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+from itertools import islice
 import json
 
-# for error handling
-from requests.exceptions import ConnectTimeout
+# any of these in a holding response means Alma returned an error instead
+HOLDING_ERROR_PATTERN = re.compile(rb"is not valid|INTERNAL_SERVER_ERROR|Search failed")
 
+# matches the raw XML of a 966 or 856 datafield, with either quote style
+BOOKPLATE_TAGS_PATTERN = re.compile(rb"tag=[\"'](?:966|856)[\"']")
 
+# bookplates to leave in 966 field (FTVA SPACs)
+BOOKPLATES_TO_LEAVE = frozenset(
+    [
+        "AFC",
+        "AFI",
+        "AHA",
+        "AM",
+        "AMA",
+        "AMAS",
+        "AMI",
+        "AMP",
+        "BBA",
+        "CFS",
+        "CSC",
+        "DEN",
+        "DGA",
+        "DLX",
+        "ERO",
+        "FNF",
+        "GKC",
+        "HEA",
+        "HHF",
+        "HLC",
+        "HRC",
+        "ICC",
+        "IWF",
+        "JCC",
+        "JUN",
+        "LAI",
+        "LAR",
+        "MCC",
+        "MIC",
+        "MP",
+        "MPC",
+        "MTC",
+        "OUT",
+        "PHI",
+        "PPB",
+        "PPI",
+        "QRC",
+        "RA",
+        "RAS",
+        "RHE",
+        "SOD",
+        "STC",
+        "SUN",
+        "TV",
+        "UTV",
+        "WBA",
+        "WEL",
+        "WIF",
+    ]
+)
+
+# how often (in records) to record the index a re-run can resume from
+PROGRESS_INTERVAL = 100
+
+# holdings processed at once; Alma handles about 10 concurrent requests well
+MAX_WORKERS = 10
+
+# how often (in holdings) to commit newly processed holdings to the processed db
+PROCESSED_COMMIT_INTERVAL = 50
+
+# outcomes of processing a single holding
+UPDATED = "updated"
+SKIPPED = "skipped"
+ERRORED = "errored"
+
+
+def configure_logging(log_filename: str, log_level: str) -> None:
+    """Log to log_filename, with the file written from a background thread.
+
+    Logging calls only put records on a queue, so the processing loop
+    doesn't wait on disk writes.
+    """
+    log_queue = queue.Queue()
+    logging.basicConfig(level=log_level, handlers=[QueueHandler(log_queue)])
+    # delay opening the file until the first record is written
+    file_handler = logging.FileHandler(log_filename, delay=True)
+    log_listener = QueueListener(log_queue, file_handler)
+    log_listener.start()
+    # flush any queued records before the script exits
+    atexit.register(log_listener.stop)
+
+
+# the report is large and slow to pull; fetch it at most once per process
+@lru_cache(maxsize=1)
 def get_bookplates_report(analytics_api_key: str) -> list:
     # analytics only available in prod environment
     aac = AlmaAnalyticsClient(analytics_api_key)
@@ -28,159 +131,344 @@ def get_bookplates_report(analytics_api_key: str) -> list:
     return report
 
 
-def needs_966_removed(field_966: Field, bookplates_to_leave: list) -> bool:
+def load_report_data_from_file(file_path: str) -> Iterator[dict]:
+    """Yield report rows saved locally, instead of fetching from analytics.
+
+    CSV files are read one row at a time; JSON files must contain a list of rows.
+    """
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    else:
+        # json accepts bytes directly, which skips a separate text decoding pass
+        with open(file_path, "rb") as f:
+            yield from json.loads(f.read())
+
+
+@lru_cache(maxsize=None)
+def get_bookplates_pattern(bookplates_to_leave: frozenset) -> re.Pattern:
+    """Compile a single regex matching any of the SPACs, as a substring.
+
+    This lets each subfield be scanned once, instead of once per SPAC.
+    Cached, since the same SPACs are checked for every 966 field.
+    """
+    if not bookplates_to_leave:
+        # an empty pattern would match everything; this one never matches
+        return re.compile(r"(?!)")
+    return re.compile("|".join(re.escape(spac) for spac in sorted(bookplates_to_leave)))
+
+
+def needs_966_removed(subfields_a: list[str], bookplates_to_leave: frozenset) -> bool:
     # only remove 966s that don't contain any of the SPACs in bookplates_to_leave in $a
-    subfields = field_966.get_subfields("a")
-    for term in bookplates_to_leave:
-        for subfield in subfields:
-            if term in subfield:
-                logging.info(f"Found {term} in 966 field")
-                return False
+    bookplates_pattern = get_bookplates_pattern(bookplates_to_leave)
+    for subfield in subfields_a:
+        match = bookplates_pattern.search(subfield)
+        if match:
+            logging.debug("Found %s in 966 field", match.group())
+            return False
     return True
 
 
-def needs_856_removed(field_856: Field) -> bool:
+def needs_856_removed(subfields_3: list[str]) -> bool:
     # only remove 856s that contain "Bookplate" in $3
-    subfields = field_856.get_subfields("3")
-    for subfield in subfields:
-        if "Bookplate" in subfield:
+    return any("Bookplate" in subfield for subfield in subfields_3)
+
+
+def write_errored_holding(errored_filename: str, mms_id: str, holding_id: str) -> None:
+    """Append an errored holding to the JSONL errors file, closing it immediately
+    so the error list survives a crash. The file is only created by the first error.
+    """
+    with open(errored_filename, "a") as errored_file:
+        errored_file.write(
+            json.dumps({"MMS Id": mms_id, "Holding Id": holding_id}) + "\n"
+        )
+
+
+def write_progress(progress_filename: str, next_index: int) -> None:
+    """Record the report index to pass as --start-index when resuming a run."""
+    with open(progress_filename, "w") as f:
+        f.write(f"{next_index}\n")
+
+
+def remove_bookplate_fields(
+    alma_holding: bytes, bookplates_to_leave: frozenset, mms_id: str, holding_id: str
+) -> Optional[bytes]:
+    """Remove bookplate 966 and 856 fields from an Alma holding record.
+
+    Returns the updated holding, ready to send to Alma, or None if nothing was removed.
+    This makes no API calls, so it can run separately from fetching and updating.
+    """
+    # a byte scan is much cheaper than parsing, and rules out holdings with no
+    # bookplate fields at all
+    if not BOOKPLATE_TAGS_PATTERN.search(alma_holding):
+        logging.info(
+            "No 966 or 856 found for MMS ID %s, Holding ID %s", mms_id, holding_id
+        )
+        return None
+
+    def check_966(field_966: Field) -> bool:
+        # get_subfields builds a new list each call, so get $a once for the check
+        # and the log message
+        subfields_a = field_966.get_subfields("a")
+        if needs_966_removed(subfields_a, bookplates_to_leave):
+            logging.debug(
+                "Removing 966 bookplate from MMS ID %s, Holding ID %s ($a: %s)",
+                mms_id,
+                holding_id,
+                subfields_a,
+            )
+            return True
+        logging.debug(
+            "Not removing 966 bookplate from MMS ID %s, Holding ID %s ($a: %s)",
+            mms_id,
+            holding_id,
+            subfields_a,
+        )
+        return False
+
+    def check_856(field_856: Field) -> bool:
+        subfields_z = field_856.get_subfields("z")
+        if needs_856_removed(field_856.get_subfields("3")):
+            logging.debug(
+                "Removing 856 bookplate from MMS ID %s, Holding ID %s ($z: %s)",
+                mms_id,
+                holding_id,
+                subfields_z,
+            )
             return True
-    return False
+        logging.debug(
+            "Not removing 856 bookplate from MMS ID %s, Holding ID %s ($z: %s)",
+            mms_id,
+            holding_id,
+            subfields_z,
+        )
+        return False
+
+    # only the 966 and 856 fields are converted to Pymarc; everything else in the
+    # holding is left as it came from Alma
+    new_alma_holding, removed_fields = remove_fields_from_bib(
+        alma_holding, {"966": check_966, "856": check_856}
+    )
+    if not removed_fields:
+        logging.info("No changes made to MMS ID %s, Holding ID %s", mms_id, holding_id)
+        return None
+    return new_alma_holding
+
+
+def process_holding(
+    mms_id: str,
+    holding_id: str,
+    client: AlmaAPIClient,
+    bookplates_to_leave: frozenset,
+    rate_limiter: SlidingWindowRateLimiter = None,
+) -> str:
+    """Fetch one holding, remove its bookplates and send the update to Alma.
+
+    Returns UPDATED, SKIPPED or ERRORED. Safe to run in several threads at once.
+    """
+    try:
+        alma_holding_record = call_with_retry(
+            client.get_holding, mms_id, holding_id, rate_limiter=rate_limiter
+        )
+    except RETRY_EXCEPTIONS as e:
+        logging.error(
+            "Error finding MMS ID %s, Holding ID %s: %s", mms_id, holding_id, e
+        )
+        return ERRORED
+    alma_holding = alma_holding_record.get("content")
+    # make sure we got a valid holding
+    if alma_holding is None or HOLDING_ERROR_PATTERN.search(alma_holding):
+        logging.error(
+            "Error finding MMS ID %s, Holding ID %s. Skipping this record.",
+            mms_id,
+            holding_id,
+        )
+        return ERRORED
+
+    new_alma_holding = remove_bookplate_fields(
+        alma_holding, bookplates_to_leave, mms_id, holding_id
+    )
+    if new_alma_holding is None:
+        return SKIPPED
+
+    # deal with possible connection or rate limit errors
+    try:
+        call_with_retry(
+            client.update_holding,
+            mms_id,
+            holding_id,
+            new_alma_holding,
+            rate_limiter=rate_limiter,
+        )
+    except RETRY_EXCEPTIONS as e:
+        logging.error(
+            "Error updating MMS ID %s, Holding ID %s: %s", mms_id, holding_id, e
+        )
+        return ERRORED
+    logging.info("Updated MMS ID %s, Holding ID %s", mms_id, holding_id)
+    return UPDATED
+
+
+def open_processed_db(db_path: str) -> sqlite3.Connection:
+    """Open the database of holdings already processed, creating it if needed.
+
+    Holdings recorded here are skipped on later runs, so an interrupted run can be
+    re-run without fetching the holdings it already finished.
+    """
+    connection = sqlite3.connect(db_path)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS done "
+        "(mms_id TEXT, holding_id TEXT, PRIMARY KEY (mms_id, holding_id))"
+    )
+    return connection
+
+
+def is_processed(
+    processed_db: sqlite3.Connection, mms_id: str, holding_id: str
+) -> bool:
+    cursor = processed_db.execute(
+        "SELECT 1 FROM done WHERE mms_id = ? AND holding_id = ?", (mms_id, holding_id)
+    )
+    return cursor.fetchone() is not None
+
+
+def _collect_results(
+    done: set,
+    pending: dict,
+    status_counts: Counter,
+    errored_filename: str,
+    processed_db: sqlite3.Connection,
+) -> None:
+    """Count the status of each finished holding, recording any errors.
+
+    Updated and skipped holdings are recorded in processed_db; errored holdings are
+    not, so they are tried again on the next run.
+    """
+    for future in done:
+        _, mms_id, holding_id = pending.pop(future)
+        status = future.result()
+        status_counts[status] += 1
+        if status == ERRORED:
+            write_errored_holding(errored_filename, mms_id, holding_id)
+            continue
+        processed_db.execute(
+            "INSERT OR IGNORE INTO done VALUES (?, ?)", (mms_id, holding_id)
+        )
+        # commit in batches, rather than syncing the db after every holding
+        if processed_db.total_changes % PROCESSED_COMMIT_INTERVAL == 0:
+            processed_db.commit()
 
 
 def remove_bookplates(
-    report_data: list,
+    report_data: Iterable[dict],
     client: AlmaAPIClient,
-    bookplates_to_leave: list,
+    bookplates_to_leave: frozenset,
     start_index: int = 0,
     limit: int = None,
+    rate_limiter: SlidingWindowRateLimiter = None,
+    max_workers: int = MAX_WORKERS,
+    processed_db_path: str = ":memory:",
 ):
-    # slice the report data to specified start index and limit
-    report_data = report_data[start_index:]
-    if limit:
-        report_data = report_data[:limit]
-
-    logging.info(f"Processing {len(report_data)} bookplates")
-    errored_holdings_count = 0
-    updated_holdings_count = 0
-    skipped_holdings_count = 0
-    errored_holdings = []
-    for index, item in enumerate(report_data):
-        logging.info(f"Current report index: {index + start_index}")
-        mms_id = item["MMS Id"]
-        holding_id = item["Holding Id"]
-        try:
-            alma_holding_record = retry_call(
-                client.get_holding,
-                fargs=(mms_id, holding_id),
-                tries=3,
-                delay=20,
-                backoff=2,
-            )
-        except ConnectTimeout as e:
-            logging.error(
-                f"Error finding MMS ID {mms_id}, Holding ID {holding_id}: {e}"
-            )
-            errored_holdings_count += 1
-            errored_holdings.append({"MMS Id": mms_id, "Holding Id": holding_id})
-            continue
-        alma_holding = alma_holding_record.get("content")
-        # make sure we got a valid bib
-        if (
-            b"is not valid" in alma_holding
-            or b"INTERNAL_SERVER_ERROR" in alma_holding
-            or b"Search failed" in alma_holding
-            or alma_holding is None
-        ):
-            logging.error(
-                f"Error finding MMS ID {mms_id}, Holding ID {holding_id}. Skipping this record."
-            )
-            errored_holdings_count += 1
-            errored_holdings.append({"MMS Id": mms_id, "Holding Id": holding_id})
-
-        else:
-            # convert to Pymarc to handle fields and subfields
-            pymarc_record = get_pymarc_record_from_bib(alma_holding)
-            pymarc_966_fields = pymarc_record.get_fields("966")
-            pymarc_856_fields = pymarc_record.get_fields("856")
-            if not pymarc_966_fields and not pymarc_856_fields:
-                logging.info(
-                    f"No 966 or 856 found for MMS ID {mms_id}, Holding ID {holding_id}"
-                )
-                skipped_holdings_count += 1
-            else:
-                for field_966 in pymarc_966_fields:
-                    if needs_966_removed(field_966, bookplates_to_leave):
-                        pymarc_record.remove_field(field_966)
-                        logging.info(
-                            f"Removing 966 bookplate from MMS ID {mms_id}, "
-                            f"Holding ID {holding_id} ($a: {field_966.get_subfields('a')})"
-                        )
-                    else:
-                        logging.info(
-                            f"Not removing 966 bookplate from MMS ID {mms_id}, "
-                            f"Holding ID {holding_id} ($a: {field_966.get_subfields('a')})",
-                        )
-                for field_856 in pymarc_856_fields:
-                    if needs_856_removed(field_856):
-                        pymarc_record.remove_field(field_856)
-                        logging.info(
-                            f"Removing 856 bookplate from MMS ID {mms_id}, "
-                            f"Holding ID {holding_id} ($z: {field_856.get_subfields('z')})"
-                        )
-                    else:
-                        logging.info(
-                            f"Not removing 856 bookplate from MMS ID {mms_id}, "
-                            f"Holding ID {holding_id} ($z: {field_856.get_subfields('z')})",
-                        )
-
-                # check if any changes were made
-                if pymarc_record == get_pymarc_record_from_bib(alma_holding):
+    # iterate over the specified start index and limit without copying the report
+    stop_index = start_index + limit if limit else None
+    report_iter = islice(report_data, start_index, stop_index)
+
+    logging.info("Processing bookplates starting at report index %d", start_index)
+    processed_holdings_count = 0
+    duplicate_rows_count = 0
+    already_processed_count = 0
+    status_counts = Counter()
+    # the report can list a holding more than once, if it has several bookplates;
+    # each holding needs only one GET and PUT
+    seen_holdings = set()
+    # futures for holdings in flight, mapped to (report index, MMS ID, Holding ID)
+    pending = {}
+
+    # errored holdings are written as they occur, one JSON object per line,
+    # so they are not lost if the run is interrupted; a run without errors
+    # leaves no errors file
+    output_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
+    errored_filename = f"errored_holdings_{output_datetime}.jsonl"
+    progress_filename = f"progress_{output_datetime}.txt"
+    processed_db = open_processed_db(processed_db_path)
+    try:
+        # holdings are independent, so their API calls can overlap
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index, item in enumerate(report_iter, start=start_index):
+                # everything before the earliest holding still in flight
+                # has been processed
+                if index > start_index and index % PROGRESS_INTERVAL == 0:
+                    in_flight = (
+                        pending_index for pending_index, _, _ in pending.values()
+                    )
+                    write_progress(progress_filename, min(in_flight, default=index))
                     logging.info(
-                        f"No changes made to MMS ID {mms_id}, Holding ID {holding_id}"
+                        "Progress: report index %d, %d updated, %d skipped, "
+                        "%d errored",
+                        index,
+                        status_counts[UPDATED],
+                        status_counts[SKIPPED],
+                        status_counts[ERRORED],
+                    )
+                logging.debug("Current report index: %d", index)
+                processed_holdings_count += 1
+                mms_id = item["MMS Id"]
+                holding_id = item["Holding Id"]
+                if (mms_id, holding_id) in seen_holdings:
+                    logging.debug(
+                        "Skipping duplicate row for MMS ID %s, Holding ID %s",
+                        mms_id,
+                        holding_id,
                     )
-                    skipped_holdings_count += 1
-                else:
-                    # convert back to Alma Holding and send update
-                    new_alma_holding = prepare_bib_for_update(
-                        alma_holding, pymarc_record
+                    duplicate_rows_count += 1
+                    continue
+                seen_holdings.add((mms_id, holding_id))
+                if is_processed(processed_db, mms_id, holding_id):
+                    logging.debug(
+                        "Skipping already processed MMS ID %s, Holding ID %s",
+                        mms_id,
+                        holding_id,
                     )
-                    # deal with possible ConnectTimeout error
-                    try:
-                        retry_call(
-                            client.update_holding,
-                            fargs=(mms_id, holding_id, new_alma_holding),
-                            tries=3,
-                            delay=20,
-                            backoff=2,
-                        )
-                        client.update_holding(mms_id, holding_id, new_alma_holding)
-                    except ConnectTimeout as e:
-                        logging.error(
-                            f"Error updating MMS ID {mms_id}, Holding ID {holding_id}: {e}"
-                        )
-                        errored_holdings_count += 1
-                        errored_holdings.append(
-                            {"MMS Id": mms_id, "Holding Id": holding_id}
-                        )
-                    else:
-
-                        logging.info(
-                            f"Updated MMS ID {mms_id}, Holding ID {holding_id}"
-                        )
-                        updated_holdings_count += 1
+                    already_processed_count += 1
+                    continue
+
+                future = executor.submit(
+                    process_holding,
+                    mms_id,
+                    holding_id,
+                    client,
+                    bookplates_to_leave,
+                    rate_limiter,
+                )
+                pending[future] = (index, mms_id, holding_id)
+                # don't queue up the whole report; wait for some holdings to finish
+                if len(pending) >= max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect_results(
+                        done, pending, status_counts, errored_filename, processed_db
+                    )
+
+            done, _ = wait(pending)
+            _collect_results(
+                done, pending, status_counts, errored_filename, processed_db
+            )
+    finally:
+        # keep the holdings recorded so far, even if the run was interrupted
+        processed_db.commit()
+        processed_db.close()
+
+    write_progress(progress_filename, start_index + processed_holdings_count)
     logging.info("Finished Bookplate Updates")
-    logging.info(f"Total Holdings Updated: {updated_holdings_count}")
-    logging.info(f"Total Holdings Skipped: {skipped_holdings_count}")
-    logging.info(f"Total Holdings Errored: {errored_holdings_count}")
-    if errored_holdings:
-        logging.info(f"Errored Holdings: {errored_holdings}")
-        # write errored holdings to file
-        output_filename = (
-            f"errored_holdings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        )
-        with open(output_filename, "w") as f:
-            json.dump(errored_holdings, f)
+    logging.info("Total Holdings Processed: %d", processed_holdings_count)
+    logging.info("Total Holdings Updated: %d", status_counts[UPDATED])
+    logging.info("Total Holdings Skipped: %d", status_counts[SKIPPED])
+    logging.info("Total Holdings Errored: %d", status_counts[ERRORED])
+    logging.info("Total Duplicate Rows Skipped: %d", duplicate_rows_count)
+    logging.info(
+        "Total Holdings Skipped as Already Processed: %d", already_processed_count
+    )
+    if status_counts[ERRORED]:
+        logging.info("Errored Holdings written to %s", errored_filename)
 
 
 def main():
@@ -194,7 +482,7 @@ def main():
         "--log-level",
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         default="INFO",
-        help="Set the logging level",
+        help="Set the logging level; per-holding details are logged at DEBUG",
     )
     parser.add_argument(
         "--start-index",
@@ -208,17 +496,40 @@ def main():
         default=None,
         help="Limit the number of records to process",
     )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=DEFAULT_REQUESTS_PER_MINUTE,
+        help="Maximum Alma API requests per minute "
+        f"(default: {DEFAULT_REQUESTS_PER_MINUTE})",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"Number of holdings to process concurrently (default: {MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--processed-db-path",
+        type=str,
+        default=None,
+        help="SQLite file of holdings already processed, which are skipped "
+        "(default: remove_bookplates_processed_<environment>.sqlite)",
+    )
     parser.add_argument(
         "--local-report-data-path",
         type=str,
         default=None,
-        help="Path to local report data file, to use instead of fetching from analytics",
+        help="Path to local report data file (.json or .csv), "
+        "to use instead of fetching from analytics",
     )
     args = parser.parse_args()
+    if args.rpm < 1:
+        parser.error("--rpm must be at least 1")
 
     logging_datetime = datetime.now().strftime("%Y%m%d_%H%M%S")
     base_filename = f"remove_bookplates_{logging_datetime}"
-    logging.basicConfig(filename=f"{base_filename}.log", level=args.log_level)
+    configure_logging(f"{base_filename}.log", args.log_level)
     # always suppress urllib3 logs with lower level than WARNING
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
@@ -232,70 +543,32 @@ def main():
         alma_api_key = API_KEYS["DIIT_SCRIPTS"]
 
     if args.local_report_data_path:
-        logging.info(f"Using local report data from {args.local_report_data_path}")
-        with open(args.local_report_data_path, "r") as f:
-            report_data = json.load(f)
+        logging.info("Using local report data from %s", args.local_report_data_path)
+        report_data = load_report_data_from_file(args.local_report_data_path)
 
     else:
         logging.info("Getting bookplate report data")
         report_data = get_bookplates_report(analytics_api_key)
 
-    client = AlmaAPIClient(alma_api_key)
+    client = AlmaAPIClient(alma_api_key, pool_maxsize=args.max_workers)
 
-    # bookplates to leave in 966 field (FTVA SPACs)
-    bookplates_to_leave_966 = [
-        "AFC",
-        "AFI",
-        "AHA",
-        "AM",
-        "AMA",
-        "AMAS",
-        "AMI",
-        "AMP",
-        "BBA",
-        "CFS",
-        "CSC",
-        "DEN",
-        "DGA",
-        "DLX",
-        "ERO",
-        "FNF",
-        "GKC",
-        "HEA",
-        "HHF",
-        "HLC",
-        "HRC",
-        "ICC",
-        "IWF",
-        "JCC",
-        "JUN",
-        "LAI",
-        "LAR",
-        "MCC",
-        "MIC",
-        "MP",
-        "MPC",
-        "MTC",
-        "OUT",
-        "PHI",
-        "PPB",
-        "PPI",
-        "QRC",
-        "RA",
-        "RAS",
-        "RHE",
-        "SOD",
-        "STC",
-        "SUN",
-        "TV",
-        "UTV",
-        "WBA",
-        "WEL",
-        "WIF",
-    ]
+    # kept per environment, so a sandbox run doesn't mark production holdings done
+    processed_db_path = (
+        args.processed_db_path
+        or f"remove_bookplates_processed_{args.environment}.sqlite"
+    )
+
+    rate_limiter = get_rate_limiter(args.rpm)
 
     remove_bookplates(
-        report_data, client, bookplates_to_leave_966, args.start_index, args.limit
+        report_data,
+        client,
+        BOOKPLATES_TO_LEAVE,
+        args.start_index,
+        args.limit,
+        rate_limiter,
+        args.max_workers,
+        processed_db_path,
     )
 
 
@@ -114,6 +114,42 @@ class TestAddBibEbookplates(unittest.TestCase):
             needs_bookplate_update(old_field, spac_code, spac_name, spac_url)
         )
 
+    def test_needs_bookplate_update_no_original_a(self):
+        old_field = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="b", value="SPAC Name"),
+                Subfield(code="c", value="https://example.com"),
+            ],
+        )
+        spac_code = "SPAC"
+        spac_name = "SPAC Name"
+        spac_url = "https://example.com"
+
+        # A 966 without $a has no SPAC code, so it can't match
+        self.assertFalse(
+            needs_bookplate_update(old_field, spac_code, spac_name, spac_url)
+        )
+
+    def test_needs_bookplate_update_no_original_b(self):
+        old_field = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="SPAC"),
+                Subfield(code="c", value="https://example.com"),
+            ],
+        )
+        spac_code = "SPAC"
+        spac_name = "SPAC Name"
+        spac_url = "https://example.com"
+
+        # We will need to add the bookplate text, since there is no $b subfield
+        self.assertTrue(
+            needs_bookplate_update(old_field, spac_code, spac_name, spac_url)
+        )
+
     def test_needs_bookplate_update_no_original_c(self):
         old_field = Field(
             tag="966",
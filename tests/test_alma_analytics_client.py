@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import patch
+from alma_analytics_client import AlmaAnalyticsClient
+
+
+def get_report_page(rows_xml: str, is_finished: str, with_schema: bool) -> dict:
+    """Build an Analytics API response like Alma's, with rows_xml as the data."""
+    schema = (
+        '<xsd:schema xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:saw-sql="urn:saw-sql">'
+        '<xsd:complexType name="Row"><xsd:sequence>'
+        '<xsd:element name="Column0" saw-sql:columnHeading="0"/>'
+        '<xsd:element name="Column1" saw-sql:columnHeading="MMS Id"/>'
+        "</xsd:sequence></xsd:complexType></xsd:schema>"
+    )
+    xml = (
+        "<QueryResult>"
+        "<ResumptionToken>token</ResumptionToken>"
+        f"<IsFinished>{is_finished}</IsFinished>"
+        f"<ResultXml><rowset>{schema if with_schema else ''}{rows_xml}</rowset>"
+        "</ResultXml></QueryResult>"
+    )
+    return {"anies": [xml]}
+
+
+class TestAlmaAnalyticsClient(unittest.TestCase):
+    def setUp(self):
+        self.aac = AlmaAnalyticsClient("fake-api-key")
+        self.aac.set_report_path("/shared/Test Report")
+        # two pages: the first with two rows, the second with a single row,
+        # which Analytics returns as a bare element rather than a list
+        self.pages = [
+            get_report_page(
+                "<Row><Column0>0</Column0><Column1>991</Column1></Row>"
+                "<Row><Column0>0</Column0><Column1>992</Column1></Row>",
+                is_finished="false",
+                with_schema=True,
+            ),
+            get_report_page(
+                "<Row><Column0>0</Column0><Column1>993</Column1></Row>",
+                is_finished="true",
+                with_schema=False,
+            ),
+        ]
+
+    def test_get_report(self):
+        with patch.object(
+            self.aac.alma_client, "get_analytics_report", side_effect=self.pages
+        ) as get_analytics_report:
+            report = self.aac.get_report()
+        # column names from the first page are applied to every page
+        self.assertEqual(
+            report, [{"MMS Id": "991"}, {"MMS Id": "992"}, {"MMS Id": "993"}]
+        )
+        # the second page is requested with the first page's resumption token
+        self.assertEqual(get_analytics_report.call_count, 2)
+        self.assertEqual(get_analytics_report.call_args.args[0]["token"], "token")
+
+    def test_get_report_iter(self):
+        with patch.object(
+            self.aac.alma_client, "get_analytics_report", side_effect=self.pages
+        ) as get_analytics_report:
+            report_iter = self.aac.get_report_iter()
+            # nothing is fetched until rows are requested
+            self.assertEqual(get_analytics_report.call_count, 0)
+            self.assertEqual(next(report_iter), {"MMS Id": "991"})
+            self.assertEqual(get_analytics_report.call_count, 1)
+            self.assertEqual(list(report_iter), [{"MMS Id": "992"}, {"MMS Id": "993"}])
+            self.assertEqual(get_analytics_report.call_count, 2)
+
+    def test_get_report_no_path(self):
+        aac = AlmaAnalyticsClient("fake-api-key")
+        with self.assertRaises(ValueError):
+            aac.get_report()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import Mock, patch
+from requests.exceptions import ConnectionError
+from alma_api_client import AlmaRateLimitError, call_with_retry
+
+
+class TestAlmaAPIClient(unittest.TestCase):
+    def setUp(self):
+        self.ok_response = {"content": b"ok", "api_response": {"status_code": 200}}
+
+    @patch("alma_api_client.sleep")
+    def test_call_with_retry_jitters_first_wait(self, mock_sleep):
+        api_method = Mock()
+        # workers which fail together should not all retry at the same moment
+        waits = set()
+        for _ in range(5):
+            api_method.side_effect = [ConnectionError("down"), self.ok_response]
+            self.assertEqual(call_with_retry(api_method, "1"), self.ok_response)
+            waits.add(mock_sleep.call_args.args[0])
+        self.assertGreater(len(waits), 1)
+        for wait_seconds in waits:
+            self.assertTrue(10 <= wait_seconds <= 20)
+
+    @patch("alma_api_client.sleep")
+    def test_call_with_retry_gives_up(self, mock_sleep):
+        api_method = Mock(side_effect=ConnectionError("down"))
+        with self.assertRaises(ConnectionError):
+            call_with_retry(api_method, "1")
+        self.assertEqual(api_method.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch("alma_api_client.sleep")
+    def test_call_with_retry_rate_limited(self, mock_sleep):
+        rate_limited_response = {
+            "api_response": {
+                "status_code": 429,
+                "headers": {"Retry-After": "5"},
+                "request_url": "https://example.com",
+            }
+        }
+        api_method = Mock(side_effect=[rate_limited_response, self.ok_response])
+        rate_limiter = Mock()
+        self.assertEqual(
+            call_with_retry(api_method, "1", rate_limiter=rate_limiter),
+            self.ok_response,
+        )
+        # Retry-After is honored, and each attempt waits for the rate limiter
+        self.assertEqual(mock_sleep.call_args_list[0].args, (5,))
+        self.assertEqual(rate_limiter.acquire.call_count, 2)
+
+    @patch("alma_api_client.sleep")
+    def test_call_with_retry_rate_limited_gives_up(self, mock_sleep):
+        rate_limited_response = {
+            "api_response": {
+                "status_code": 429,
+                "headers": {},
+                "request_url": "https://example.com",
+            }
+        }
+        api_method = Mock(return_value=rate_limited_response)
+        with self.assertRaises(AlmaRateLimitError):
+            call_with_retry(api_method, "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import xml.etree.ElementTree as ET
+from alma_marc import get_pymarc_field_from_datafield, remove_fields_from_bib
+
+SAMPLE_HOLDING = (
+    b"<holding><holding_id>22123</holding_id><record>"
+    b"<leader>00000nx  a2200000zn 4500</leader>"
+    b'<controlfield tag="001">22123</controlfield>'
+    b'<datafield ind1="0" ind2=" " tag="852"><subfield code="b">YRL</subfield>'
+    b"</datafield>"
+    b'<datafield ind1=" " ind2=" " tag="966"><subfield code="a">SPAC1</subfield>'
+    b'<subfield code="b">SPAC Name</subfield></datafield>'
+    b'<datafield ind1="4" ind2="2" tag="856"><subfield code="3">Bookplate</subfield>'
+    b'<subfield code="u">https://example.com</subfield></datafield>'
+    b"</record></holding>"
+)
+
+
+class TestAlmaMarc(unittest.TestCase):
+    def test_get_pymarc_field_from_datafield(self):
+        datafield = ET.fromstring(
+            '<datafield ind1="4" ind2="2" tag="856">'
+            '<subfield code="3">Bookplate</subfield>'
+            '<subfield code="u">https://example.com</subfield>'
+            "</datafield>"
+        )
+        field = get_pymarc_field_from_datafield(datafield)
+        self.assertEqual(field.tag, "856")
+        self.assertEqual(field.get_subfields("3"), ["Bookplate"])
+        self.assertEqual(field.get_subfields("u"), ["https://example.com"])
+
+    def test_remove_fields_from_bib(self):
+        new_holding, removed_fields = remove_fields_from_bib(
+            SAMPLE_HOLDING, {"966": lambda field: True}
+        )
+        self.assertEqual([field.tag for field in removed_fields], ["966"])
+        record = ET.fromstring(new_holding).find("record")
+        tags = [datafield.get("tag") for datafield in record.findall("datafield")]
+        self.assertEqual(tags, ["852", "856"])
+        # the rest of the holding is kept
+        self.assertEqual(ET.fromstring(new_holding).findtext("holding_id"), "22123")
+
+    def test_remove_fields_from_bib_uses_check(self):
+        new_holding, removed_fields = remove_fields_from_bib(
+            SAMPLE_HOLDING,
+            {
+                "966": lambda field: "SPAC2" in field.get_subfields("a"),
+                "856": lambda field: "Bookplate" in field.get_subfields("3"),
+            },
+        )
+        self.assertEqual([field.tag for field in removed_fields], ["856"])
+        record = ET.fromstring(new_holding).find("record")
+        tags = [datafield.get("tag") for datafield in record.findall("datafield")]
+        self.assertEqual(tags, ["852", "966"])
+
+    def test_remove_fields_from_bib_no_changes(self):
+        new_holding, removed_fields = remove_fields_from_bib(
+            SAMPLE_HOLDING, {"966": lambda field: False}
+        )
+        self.assertEqual(removed_fields, [])
+        self.assertIs(new_holding, SAMPLE_HOLDING)
+
+
+if __name__ == "__main__":
+    unittest.main()
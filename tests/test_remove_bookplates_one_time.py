@@ -0,0 +1,106 @@
+import unittest
+from pymarc import Field, Subfield
+from remove_bookplates_one_time import (
+    is_processed,
+    needs_966_removed,
+    needs_856_removed,
+    open_processed_db,
+)
+
+
+class TestRemoveBookplatesOneTime(unittest.TestCase):
+    def setUp(self):
+        self.bookplates_to_leave = frozenset(["AFC", "TV"])
+
+    def test_needs_966_removed(self):
+        field_966 = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="SPAC1"),
+                Subfield(code="b", value="SPAC Name"),
+            ],
+        )
+        subfields_a = field_966.get_subfields("a")
+        self.assertTrue(needs_966_removed(subfields_a, self.bookplates_to_leave))
+
+    def test_needs_966_removed_exact_match(self):
+        field_966 = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="AFC"),
+                Subfield(code="b", value="SPAC Name"),
+            ],
+        )
+        subfields_a = field_966.get_subfields("a")
+        self.assertFalse(needs_966_removed(subfields_a, self.bookplates_to_leave))
+
+    def test_needs_966_removed_substring_match(self):
+        # SPACs to leave are matched anywhere in $a, not just as the whole value
+        field_966 = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="UCLA TV Archive"),
+            ],
+        )
+        subfields_a = field_966.get_subfields("a")
+        self.assertFalse(needs_966_removed(subfields_a, self.bookplates_to_leave))
+
+    def test_needs_966_removed_multiple_a(self):
+        # any $a containing a SPAC to leave keeps the field
+        field_966 = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="SPAC1"),
+                Subfield(code="a", value="AFC"),
+            ],
+        )
+        subfields_a = field_966.get_subfields("a")
+        self.assertFalse(needs_966_removed(subfields_a, self.bookplates_to_leave))
+
+    def test_needs_966_removed_no_bookplates_to_leave(self):
+        field_966 = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="AFC"),
+            ],
+        )
+        subfields_a = field_966.get_subfields("a")
+        self.assertTrue(needs_966_removed(subfields_a, frozenset()))
+
+    def test_needs_856_removed(self):
+        field_856 = Field(
+            tag="856",
+            indicators=["4", "2"],
+            subfields=[
+                Subfield(code="3", value="Bookplate"),
+                Subfield(code="u", value="https://example.com"),
+            ],
+        )
+        self.assertTrue(needs_856_removed(field_856.get_subfields("3")))
+
+    def test_needs_856_removed_not_bookplate(self):
+        field_856 = Field(
+            tag="856",
+            indicators=["4", "0"],
+            subfields=[
+                Subfield(code="3", value="Finding aid"),
+                Subfield(code="u", value="https://example.com"),
+            ],
+        )
+        self.assertFalse(needs_856_removed(field_856.get_subfields("3")))
+
+    def test_is_processed(self):
+        processed_db = open_processed_db(":memory:")
+        processed_db.execute("INSERT INTO done VALUES (?, ?)", ("991", "221"))
+        self.assertTrue(is_processed(processed_db, "991", "221"))
+        self.assertFalse(is_processed(processed_db, "991", "222"))
+        processed_db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,85 +1,75 @@
 import unittest
+from collections import Counter
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
 from pymarc import Field, Subfield
 from update_bookplates_one_time import (
+    ERRORED,
+    SKIPPED,
+    UPDATED,
+    FatalAPIError,
+    _collect_results,
     get_spac_mappings,
-    needs_bookplate_update,
-    get_spac_info,
+    process_bib,
+    try_update_966,
     update_existing_966,
 )
 
 
 class TestUpdateBookplatesOneTime(unittest.TestCase):
-    def test_needs_bookplate_update(self):
-        spac_mappings = [
-            {"SPAC": "SPAC1", "NAME": "SPAC Name", "URL": "https://example.com"},
-            {"SPAC": "SPAC2", "NAME": "SPAC Name2", "URL": "https://example2.com"},
-        ]
-        old_field = Field(
+    def setUp(self):
+        self.spac_mappings = {
+            "SPAC1": {"NAME": "SPAC Name", "URL": "https://example.com"},
+            "SPAC2": {"NAME": "SPAC Name2", "URL": "https://example2.com"},
+        }
+
+    def test_try_update_966(self):
+        field_966 = Field(
             tag="966",
             indicators=[" ", " "],
             subfields=[
                 Subfield(code="a", value="SPAC1"),
                 Subfield(code="b", value="Wrong SPAC Name"),
-                Subfield(code="c", value="https://example.com"),
             ],
         )
         # any matching SPAC code should trigger an update
-        self.assertTrue(needs_bookplate_update(old_field, spac_mappings))
+        self.assertTrue(try_update_966(field_966, self.spac_mappings))
+        self.assertEqual(field_966.get_subfields("b"), ["SPAC Name"])
+        self.assertEqual(field_966.get_subfields("c"), ["https://example.com"])
 
-    def test_needs_bookplate_update_no_match(self):
-        spac_mappings = [
-            {"SPAC": "SPAC1", "NAME": "SPAC Name", "URL": "https://example.com"},
-            {"SPAC": "SPAC2", "NAME": "SPAC Name2", "URL": "https://example2.com"},
-        ]
-        old_field = Field(
+    def test_try_update_966_no_match(self):
+        field_966 = Field(
             tag="966",
             indicators=[" ", " "],
             subfields=[
                 Subfield(code="a", value="SPAC3"),
                 Subfield(code="b", value="SPAC Name"),
-                Subfield(code="c", value="https://example.com"),
             ],
         )
         # no matching SPAC code should not trigger an update
-        self.assertFalse(needs_bookplate_update(old_field, spac_mappings))
+        self.assertFalse(try_update_966(field_966, self.spac_mappings))
+        self.assertEqual(field_966.get_subfields("b"), ["SPAC Name"])
 
-    def test_get_spac_info(self):
-        spac_mappings = [
-            {"SPAC": "SPAC1", "NAME": "SPAC Name", "URL": "https://example.com"},
-            {"SPAC": "SPAC2", "NAME": "SPAC Name2", "URL": "https://example2.com"},
-        ]
+    def test_try_update_966_no_spac_code(self):
         field_966 = Field(
             tag="966",
             indicators=[" ", " "],
-            subfields=[
-                Subfield(code="a", value="SPAC1"),
-                Subfield(code="b", value="SPAC Name"),
-                Subfield(code="c", value="https://example.com"),
-            ],
-        )
-        self.assertEqual(
-            get_spac_info(spac_mappings, field_966),
-            {"spac_name": "SPAC Name", "spac_url": "https://example.com"},
+            subfields=[Subfield(code="b", value="SPAC Name")],
         )
+        # a 966 without $a should not trigger an update
+        self.assertFalse(try_update_966(field_966, self.spac_mappings))
 
-    def test_get_spac_info_different_values(self):
-        spac_mappings = [
-            {"SPAC": "SPAC1", "NAME": "SPAC Name", "URL": "https://example.com"},
-            {"SPAC": "SPAC2", "NAME": "SPAC Name2", "URL": "https://example2.com"},
-        ]
+    def test_try_update_966_already_current(self):
         field_966 = Field(
             tag="966",
             indicators=[" ", " "],
             subfields=[
-                Subfield(code="a", value="SPAC1"),
-                Subfield(code="b", value="Different Name"),
-                Subfield(code="c", value="https://different-example.com"),
+                Subfield(code="a", value="SPAC2"),
+                Subfield(code="b", value="SPAC Name2"),
+                Subfield(code="c", value="https://example2.com"),
             ],
         )
-        self.assertEqual(
-            get_spac_info(spac_mappings, field_966),
-            {"spac_name": "SPAC Name", "spac_url": "https://example.com"},
-        )
+        self.assertFalse(try_update_966(field_966, self.spac_mappings))
 
     def test_update_existing_966_add_URL(self):
         old_field = Field(
@@ -93,7 +83,7 @@ class TestUpdateBookplatesOneTime(unittest.TestCase):
         )
         spac_url = "https://example.com"
         spac_name = "SPAC Name"
-        update_existing_966(old_field, spac_name, spac_url)
+        self.assertTrue(update_existing_966(old_field, spac_name, spac_url))
         self.assertEqual(old_field.get_subfields("c")[0], spac_url)
         self.assertEqual(old_field.get_subfields("b")[0], spac_name)
 
@@ -109,37 +99,126 @@ class TestUpdateBookplatesOneTime(unittest.TestCase):
         )
         spac_url = ""
         spac_name = "SPAC Name"
-        update_existing_966(old_field, spac_name, spac_url)
+        self.assertTrue(update_existing_966(old_field, spac_name, spac_url))
         self.assertEqual(old_field.get_subfields("c"), [])
         self.assertEqual(old_field.get_subfields("b")[0], spac_name)
 
+    def test_update_existing_966_no_change(self):
+        old_field = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="SPAC"),
+                Subfield(code="b", value="SPAC Name"),
+                Subfield(code="c", value="https://example.com"),
+            ],
+        )
+        original_subfields = list(old_field.subfields)
+        # a field that already has the mapped name and URL isn't changed
+        self.assertFalse(
+            update_existing_966(old_field, "SPAC Name", "https://example.com")
+        )
+        self.assertEqual(old_field.subfields, original_subfields)
+
+    def test_update_existing_966_keeps_other_subfields(self):
+        old_field = Field(
+            tag="966",
+            indicators=[" ", " "],
+            subfields=[
+                Subfield(code="a", value="SPAC"),
+                Subfield(code="b", value="Old SPAC Name"),
+                Subfield(code="c", value="https://old-example.com"),
+                Subfield(code="d", value="Other"),
+            ],
+        )
+        update_existing_966(old_field, "SPAC Name", "https://example.com")
+        self.assertEqual(
+            [(subfield.code, subfield.value) for subfield in old_field.subfields],
+            [
+                ("a", "SPAC"),
+                ("d", "Other"),
+                ("b", "SPAC Name"),
+                ("c", "https://example.com"),
+            ],
+        )
+
     def test_get_spac_mappings(self):
         spac_mappings = get_spac_mappings("tests/data/sample_SPAC_mappings.csv")
         # only four rows in the test file have a valid URL
-        sample_mappings = [
-            {
-                "SPAC": "SPAC1",
-                "NAME": "Bookplate Label #1",
-                "URL": "https://example.com",
-            },
-            {
-                "SPAC": "SPAC2",
+        sample_mappings = {
+            "SPAC1": {"NAME": "Bookplate Label #1", "URL": "https://example.com"},
+            "SPAC2": {
                 "NAME": "Bookplate Label #2",
                 "URL": "https://another-example.com",
             },
-            {
-                "SPAC": "SPAC4",
-                "NAME": "Bookplate Label #4",
-                "URL": "https://example.com",
-            },
-            {
-                "SPAC": "SPAC5",
+            "SPAC4": {"NAME": "Bookplate Label #4", "URL": "https://example.com"},
+            "SPAC5": {
                 "NAME": "Bookplate Label #5",
                 "URL": "https://another-example.com",
             },
-        ]
+        }
         self.assertEqual(spac_mappings, sample_mappings)
 
+    def test_collect_results_counts_past_fatal_error(self):
+        done = []
+        for result in [(UPDATED, "1"), (SKIPPED, "2"), (UPDATED, "3"), (ERRORED, "4")]:
+            future = Future()
+            future.set_result(result)
+            done.append(future)
+        fatal_future = Future()
+        fatal_future.set_exception(FatalAPIError("Unexpected response"))
+        done.insert(1, fatal_future)
+        status_counts = Counter()
+        # the error is raised again, but only after every other bib is counted
+        with self.assertRaises(FatalAPIError):
+            _collect_results(done, status_counts)
+        self.assertEqual(status_counts, Counter({UPDATED: 2, SKIPPED: 1, ERRORED: 1}))
+
+    def get_client(self, update_status_code: int) -> Mock:
+        bib = (
+            b"<bib><mms_id>991</mms_id><record>"
+            b"<leader>00000nam a2200000 a 4500</leader>"
+            b'<datafield ind1=" " ind2=" " tag="966">'
+            b'<subfield code="a">SPAC1</subfield>'
+            b'<subfield code="b">Old SPAC Name</subfield>'
+            b"</datafield></record></bib>"
+        )
+        client = Mock()
+        client.get_bib.return_value = {
+            "content": bib,
+            "api_response": {"status_code": 200},
+        }
+        client.update_bib.return_value = {
+            "api_response": {
+                "status_code": update_status_code,
+                "headers": {},
+                "request_url": "https://example.com",
+            }
+        }
+        return client
+
+    def test_process_bib_updated(self):
+        client = self.get_client(200)
+        self.assertEqual(
+            process_bib("991", 0, client, self.spac_mappings), (UPDATED, "991")
+        )
+        client.update_bib.assert_called_once()
+
+    def test_process_bib_update_rejected(self):
+        client = self.get_client(400)
+        self.assertEqual(
+            process_bib("991", 0, client, self.spac_mappings), (ERRORED, "991")
+        )
+
+    @patch("alma_api_client.sleep")
+    def test_process_bib_update_rate_limited(self, mock_sleep):
+        client = self.get_client(429)
+        # a rate-limited update is retried, then counted as an error
+        self.assertEqual(
+            process_bib("991", 0, client, self.spac_mappings), (ERRORED, "991")
+        )
+        self.assertEqual(client.update_bib.call_count, 3)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,25 +1,32 @@
 import pymssql
 from database_credentials import UCPATH
 
+# rows read from the server per fetch
+FETCH_SIZE = 5000
 
-def get_ucpath_query() -> str:
-    return """
+# the query never changes, so build it once at import
+UCPATH_QUERY = """
+-- Current rows are those whose EFFDT equals the latest EFFDT for the same
+-- person or job, found with max() window functions; ties are all kept.
 with ucla_people as (
     select
         EMPLID
     ,    left(UC_EXT_SYSTEM_ID, 9) as UCLA_UID
-    from PS_UC_EXT_SYSTEM es
-    where UC_EXT_SYSTEM = 'UCLA_UID'
-    and BUSINESS_UNIT in ('LACMP', 'LAMED')
-    and DML_IND <> 'D'
-    and EFFDT = (
-        select max(EFFDT)
+    from (
+        select
+            EMPLID
+        ,    UC_EXT_SYSTEM
+        ,    UC_EXT_SYSTEM_ID
+        ,    EFFDT
+        -- Latest date across all external systems, not just UCLA_UID
+        ,    max(EFFDT) over (partition by EMPLID) as MAX_EFFDT
         from PS_UC_EXT_SYSTEM
-        where EMPLID = es.EMPLID
-        and BUSINESS_UNIT in ('LACMP', 'LAMED')
+        where BUSINESS_UNIT in ('LACMP', 'LAMED')
         and DML_IND <> 'D'
         and EFFDT <= {fn curDaTe()}
-    )
+    ) es
+    where UC_EXT_SYSTEM = 'UCLA_UID'
+    and EFFDT = MAX_EFFDT
 )
 , ucla_employees as (
     -- Connect people with job info.
@@ -38,8 +45,36 @@ with ucla_people as (
     ,    pjt.DESCR
     ,    pjt.DESCRSHORT
     from ucla_people p
-    inner join PS_JOB j on p.EMPLID = j.EMPLID
-    inner join PS_JOBCODE_TBL pjt on j.JOBCODE = pjt.JOBCODE
+    inner join (
+        select
+            EMPLID
+        ,    BUSINESS_UNIT
+        ,    EMPL_STATUS
+        ,    JOB_INDICATOR
+        ,    PER_ORG
+        ,    EFFDT
+        ,    EFFSEQ
+        ,    EMPL_CLASS
+        ,    DEPTID
+        ,    POSITION_NBR
+        ,    JOBCODE
+        ,    max(EFFDT) over (partition by EMPLID, EMPL_RCD) as MAX_EFFDT
+        ,    max(EFFSEQ) over (partition by EMPLID, EMPL_RCD, EFFDT) as MAX_EFFSEQ
+        from PS_JOB
+        where DML_IND <> 'D'
+        and EFFDT <= {fn curDaTe()}
+    ) j on p.EMPLID = j.EMPLID
+    inner join (
+        select
+            JOBCODE
+        ,    EFFDT
+        ,    DESCR
+        ,    DESCRSHORT
+        -- Latest date of non-deleted rows; the row itself isn't filtered on DML_IND
+        ,    max(case when DML_IND <> 'D' then EFFDT end)
+                over (partition by JOBCODE) as MAX_EFFDT
+        from PS_JOBCODE_TBL
+    ) pjt on j.JOBCODE = pjt.JOBCODE
     where j.BUSINESS_UNIT in ('LACMP', 'LAMED')
     -- All active in one way
     and j.EMPL_STATUS in ('A','L','P','W')
@@ -49,29 +84,27 @@ with ucla_people as (
     and j.PER_ORG = 'EMP'
     -- Single space, avoid some old converted data
     and j.POSITION_NBR <> ' '
-    and j.DML_IND <> 'D'
-    and j.EFFDT = (
-        select max(EFFDT)
-        from PS_JOB
-        where EMPLID = j.EMPLID
-        and EMPL_RCD = j.EMPL_RCD
-        and DML_IND <> 'D'
-        and EFFDT <= {fn curDaTe()}
-    )
-    and j.EFFSEQ = (
-        select max(EFFSEQ)
-        from PS_JOB
-        where EMPLID = j.EMPLID
-        and EMPL_RCD = j.EMPL_RCD
-        and EFFDT = j.EFFDT
-        and DML_IND <> 'D'
-    )
-    and pjt.EFFDT = (
-        select max(EFFDT)
-        from PS_JOBCODE_TBL
-        where JOBCODE = j.JOBCODE
-        and DML_IND <> 'D'
-    )
+    and j.EFFDT = j.MAX_EFFDT
+    and j.EFFSEQ = j.MAX_EFFSEQ
+    and pjt.EFFDT = pjt.MAX_EFFDT
+)
+-- Academic job titles (DESCRSHORT, which is truncated to 10 characters),
+-- kept as a row set so the type check below can join on it
+, academic_descrshort as (
+    select DESCRSHORT
+    from (values
+        ('ACT ASSOC'), ('ACT ASST P'), ('ACT PROF-A'), ('ACT PROF-F'),
+        ('ACT PROF-H'), ('ACT PROF-S'), ('ADJ PROF-A'), ('ADJ PROF-F'),
+        ('ADJ PROF-H'), ('ADJ PROF-S'), ('ASSOC ADJ'), ('ASSOC PROF'),
+        ('ASST ADJ P'), ('ASST PROF'), ('ASST PROF-'), ('PROF EMERI'),
+        ('PROF IN RE'), ('PROF OF CL'), ('PROF-10 MO'), ('PROF-AY'),
+        ('PROF-AY-1/'), ('PROF-AY-B/'), ('PROF-AY-LA'), ('PROF-FY'),
+        ('PROF-FY-B/'), ('PROF-HCOMP'), ('PROF-SFT-V'), ('SENATE EME'),
+        ('NON-SENATE'), ('STAFF EMER'), ('STF EMERIT'), ('HS CLIN PR'),
+        ('HS ASST CL'), ('RECALL TEA'), ('UNIV PROF'), ('VIS ASST P'),
+        ('VIS PROF'), ('VIS PROF-H'), ('ACT INSTR-'), ('VISITOR-GR'),
+        ('VIS ASSOC')
+    ) as v(DESCRSHORT)
 )
 select
   u.UCLA_UID as employee_id
@@ -90,16 +123,8 @@ select
 , replace(left(pa.POSTAL, 9),',','') AS work_addr_zip
 , case
     when
-        u.EMPL_CLASS in ('3','9','10','11','14','20','21','22','23','24','24')
-    and ( (  u.DESCRSHORT in ('ACT ASSOC','ACT ASST P','ACT PROF-A','ACT PROF-F','ACT PROF-F',
-                             'ACT PROF-H','ACT PROF-S','ADJ PROF-A','ADJ PROF-F','ADJ PROF-H',
-                             'ADJ PROF-S','ASSOC ADJ','ASSOC PROF','ASST ADJ P','ASST PROF',
-                             'ASST PROF-','PROF EMERI','PROF IN RE','PROF OF CL','PROF-10 MO',
-                             'PROF-AY','PROF-AY-1/','PROF-AY-B/','PROF-AY-LA','PROF-FY',
-                             'PROF-FY-B/','PROF-HCOMP','PROF-SFT-V','SENATE EME','NON-SENATE',
-                             'STAFF EMER','STF EMERIT','HS CLIN PR', 'HS ASST CL', 'RECALL TEA',
-                             'UNIV PROF','VIS ASST P','VIS ASST P','VIS PROF','VIS PROF-H',
-                             'ACT INSTR-','VISITOR-GR','VIS ASSOC')
+        u.EMPL_CLASS in ('3','9','10','11','14','20','21','22','23','24')
+    and ( (  u.DESCRSHORT in (select DESCRSHORT from academic_descrshort)
           or u.DESCRSHORT like 'LECT%' or u.DESCRSHORT like 'SR LECT%' or u.DESCRSHORT like '%POST%'
           or u.DESCR like '%LIBRARIAN%'
           )
@@ -116,17 +141,20 @@ select
     else 0
   end as law
 from ucla_employees u
-inner join PS_NAMES n
+inner join (
+    select
+        EMPLID
+    ,    PREF_FIRST_NAME
+    ,    SECOND_LAST_NAME
+    ,    PARTNER_LAST_NAME
+    ,    EFFDT
+    ,    max(EFFDT) over (partition by EMPLID) as MAX_EFFDT
+    from PS_NAMES
+    where NAME_TYPE = 'PRI'
+    and DML_IND <> 'D'
+) n
   on u.EMPLID = n.EMPLID
-  and n.NAME_TYPE = 'PRI'
-  and n.DML_IND <> 'D'
-  and n.EFFDT = (
-      select max(EFFDT)
-      from PS_NAMES
-      where EMPLID = u.EMPLID
-      and NAME_TYPE = 'PRI'
-      and DML_IND <> 'D'
-  )
+  and n.EFFDT = n.MAX_EFFDT
 left outer join PS_EMAIL_ADDRESSES e
   on u.EMPLID = e.EMPLID
   and e.E_ADDR_TYPE = 'BUSN'
@@ -136,30 +164,42 @@ left outer join PS_PERSONAL_PHONE ph
   on u.EMPLID = ph.EMPLID
   and ph.PHONE_TYPE = 'BUSN'
   and ph.DML_IND <> 'D'
-left outer join PS_ADDRESSES pa
+left outer join (
+    select
+        EMPLID
+    ,    ADDRESS1
+    ,    ADDRESS2
+    ,    CITY
+    ,    STATE
+    ,    POSTAL
+    ,    EFFDT
+    ,    max(EFFDT) over (partition by EMPLID) as MAX_EFFDT
+    from PS_ADDRESSES
+    where ADDRESS_TYPE = 'HOME'
+    and DML_IND <> 'D'
+) pa
   on u.EMPLID = pa.EMPLID
-  and pa.ADDRESS_TYPE = 'HOME'
-  and pa.DML_IND <> 'D'
-  and pa.EFFDT = (
-      select max(EFFDT)
-      from PS_ADDRESSES
-      where EMPLID = pa.EMPLID
-      and ADDRESS_TYPE = 'HOME'
-      and DML_IND <> 'D'
-  )
-left outer join PS_POSITION_DATA pd
+  and pa.EFFDT = pa.MAX_EFFDT
+left outer join (
+    select
+        POSITION_NBR
+    ,    MAIL_DROP
+    ,    EG_ACADEMIC_RANK
+    ,    EFFDT
+    ,    max(EFFDT) over (partition by POSITION_NBR) as MAX_EFFDT
+    from PS_POSITION_DATA
+    where DML_IND <> 'D'
+) pd
   on u.POSITION_NBR = pd.POSITION_NBR
-  and pd.DML_IND <> 'D'
-  and pd.EFFDT = (
-      select max(EFFDT)
-      from PS_POSITION_DATA
-      where POSITION_NBR = pd.POSITION_NBR
-      and DML_IND <> 'D'
-      )
+  and pd.EFFDT = pd.MAX_EFFDT
 ;
 """
 
 
+def get_ucpath_query() -> str:
+    return UCPATH_QUERY
+
+
 def main():
     server = UCPATH["server"]
     database = UCPATH["database"]
@@ -168,10 +208,11 @@ def main():
     conn = pymssql.connect(server, username, password, database)
     cursor = conn.cursor(as_dict=True)
 
-    ucpath_query = get_ucpath_query()
-    cursor.execute(ucpath_query)
-    for row in cursor:
-        print(row)
+    cursor.execute(UCPATH_QUERY)
+    # read the results in batches, so only one batch is held in memory at a time
+    while rows := cursor.fetchmany(FETCH_SIZE):
+        for row in rows:
+            print(row)
     conn.close()
 
 
@@ -1,15 +1,61 @@
 import csv
 import argparse
 import logging
+import sys
 from alma_api_keys import API_KEYS
-from alma_api_client import AlmaAPIClient
+from alma_api_client import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    RETRY_EXCEPTIONS,
+    AlmaAPIClient,
+    SlidingWindowRateLimiter,
+    call_with_retry,
+    get_rate_limiter,
+)
 from alma_analytics_client import AlmaAnalyticsClient
 from alma_marc import get_pymarc_record_from_bib, prepare_bib_for_update
-from pymarc import Field
+from pymarc import Field, Subfield
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from logging.handlers import MemoryHandler
+from typing import Iterator
 
+# how often (in bibs) to log progress
+PROGRESS_INTERVAL = 500
 
-def get_mms_report(analytics_api_key: str) -> list:
-    """Get the report of MMS IDs and current 966 contents from Alma Analytics."""
+# how many log records to buffer before writing them to the log file
+LOG_BUFFER_CAPACITY = 1000
+
+# bibs processed at once; the work is almost all waiting on the Alma API
+MAX_WORKERS = 8
+
+# outcomes of processing a single bib
+UPDATED = "updated"
+SKIPPED = "skipped"
+ERRORED = "errored"
+
+
+def configure_logging(log_filename: str, log_level: str) -> None:
+    """Log to log_filename, writing records to the file in batches.
+
+    Records are buffered and written once LOG_BUFFER_CAPACITY have built up, so the
+    per-bib log lines don't each cost a write. Errors are written right away, and
+    the buffer is flushed when the script exits.
+    """
+    file_handler = logging.FileHandler(log_filename)
+    # records are formatted by the file handler when the buffer is flushed
+    file_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+    memory_handler = MemoryHandler(
+        LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler
+    )
+    logging.basicConfig(level=log_level, handlers=[memory_handler])
+
+
+def get_mms_report(analytics_api_key: str) -> Iterator[dict]:
+    """Get the report of MMS IDs and current 966 contents from Alma Analytics.
+
+    Rows are yielded as each page of the report is fetched.
+    """
     # analytics only available in prod environment
     aac = AlmaAnalyticsClient(analytics_api_key)
     report_path = (
@@ -17,60 +63,182 @@ def get_mms_report(analytics_api_key: str) -> list:
         "/Cataloging/Reports/API/MMS IDs for 966 updates"
     )
     aac.set_report_path(report_path)
-    report = aac.get_report()
-    return report
+    return aac.get_report_iter()
 
 
-def get_spac_mappings(input_file: str) -> list:
-    """Get SPAC mappings from a CSV file. Filter out any lines without a valid URL."""
-    spac_mappings = []
+def get_spac_mappings(input_file: str) -> dict:
+    """Get SPAC mappings from a CSV file. Filter out any lines without a valid URL.
+
+    Returns a dict of {SPAC code: {"NAME": name, "URL": url}}, so a 966 can be matched
+    with a single lookup.
+    """
+    spac_mappings = {}
     with open(input_file, newline="", encoding="utf-8-sig") as csv_file:
-        reader = csv.DictReader(csv_file)
+        reader = csv.reader(csv_file)
+        # only 3 columns are used, so find them once rather than building a dict
+        # of every column for every line
+        header = next(reader)
+        spac_index = header.index("SPAC")
+        name_index = header.index("NAME")
+        url_index = header.index("URL")
         for line in reader:
-            # remove leading/trailing whitespace from all values
-            line = {k: v.strip() for k, v in line.items()}
-            # first, check if the line has a valid URL. If not, skip it.
-            if not line["URL"]:
+            # skip blank lines, as DictReader does
+            if not line:
                 continue
-            elif line["URL"][:4] != "http":
+            # remove leading/trailing whitespace from the values used
+            url = line[url_index].strip()
+            # first, check if the line has a valid URL. If not, skip it.
+            if not url.startswith("http"):
                 continue
-            else:
-                current_line = {
-                    "SPAC": line["SPAC"],
-                    "NAME": line["NAME"],
-                    "URL": line["URL"],
+            spac = line[spac_index].strip()
+            # if a SPAC is listed more than once, use the first valid mapping
+            if spac not in spac_mappings:
+                spac_mappings[spac] = {
+                    "NAME": line[name_index].strip(),
+                    "URL": url,
                 }
-                spac_mappings.append(current_line)
     return spac_mappings
 
 
-def needs_bookplate_update(old_field: Field, spac_mappings: list) -> bool:
-    """Check if a 966 field matches a SPAC code. If so, assume it needs updating."""
-    # check if the SPAC code in the 966 field is in the list of SPAC mappings
-    for spac_mapping in spac_mappings:
-        if spac_mapping["SPAC"] == old_field.get_subfields("a")[0]:
-            return True
-    return False
+def update_existing_966(field_966: Field, spac_name: str, spac_url: str) -> bool:
+    """Update the URL and bookplate text in an existing 966 field.
 
-
-def get_spac_info(spac_mappings: list, field_966: Field) -> dict:
-    """Get the SPAC name and URL from the mappings to update a 966."""
-    for spac_mapping in spac_mappings:
-        if spac_mapping["SPAC"] == field_966.get_subfields("a")[0]:
-            return {"spac_name": spac_mapping["NAME"], "spac_url": spac_mapping["URL"]}
-    return {"spac_name": "", "spac_url": ""}
-
-
-def update_existing_966(field_966: Field, spac_name: str, spac_url: str) -> None:
-    """Update the URL and bookplate text in an existing 966 field."""
+    Returns True if the field was changed, False if it already had this name and URL.
+    """
+    # if spac_url is an empty string, $c is left out
+    new_c = [spac_url] if spac_url else []
+    if (
+        field_966.get_subfields("b") == [spac_name]
+        and field_966.get_subfields("c") == new_c
+    ):
+        return False
+    # rebuild the subfields in one pass, keeping everything except $b and $c
+    subfields = [
+        subfield for subfield in field_966.subfields if subfield.code not in ("b", "c")
+    ]
     # update $b for bookplate text
-    field_966.delete_subfield("b")
-    field_966.add_subfield("b", spac_name)
+    subfields.append(Subfield(code="b", value=spac_name))
     # update $c for URL
-    field_966.delete_subfield("c")
-    # if spac_url is an empty string, don't add $c back in
     if spac_url:
-        field_966.add_subfield("c", spac_url)
+        subfields.append(Subfield(code="c", value=spac_url))
+    field_966.subfields = subfields
+    return True
+
+
+def try_update_966(field_966: Field, spac_mappings: dict) -> bool:
+    """Update a 966 with the SPAC name and URL mapped to its SPAC code ($a).
+
+    Returns True if the field was changed; False if its SPAC code isn't mapped
+    or the field is already up to date.
+    """
+    subfields_a = field_966.get_subfields("a")
+    # a 966 without $a has no SPAC code
+    if not subfields_a:
+        return False
+    spac_mapping = spac_mappings.get(subfields_a[0])
+    if spac_mapping is None:
+        return False
+    return update_existing_966(field_966, spac_mapping["NAME"], spac_mapping["URL"])
+
+
+class FatalAPIError(Exception):
+    """Raised when Alma sends an unexpected response, so the run must stop."""
+
+
+def process_bib(
+    mms_id: str,
+    report_index: int,
+    client: AlmaAPIClient,
+    spac_mappings: dict,
+    rate_limiter: SlidingWindowRateLimiter = None,
+) -> tuple[str, str]:
+    """Fetch one bib, update its 966 bookplates and send the update to Alma.
+
+    Returns (status, mms_id), where status is UPDATED, SKIPPED or ERRORED.
+    Safe to run in several threads at once; if a rate_limiter is given, each API
+    call (including retries of connection errors and rate limiting) waits for it.
+    """
+    # get bib from Alma
+    try:
+        bib_response = call_with_retry(
+            client.get_bib, mms_id, rate_limiter=rate_limiter
+        )
+    except RETRY_EXCEPTIONS as e:
+        logging.error("Error finding MMS ID %s: %s", mms_id, e)
+        return ERRORED, mms_id
+    alma_bib = bib_response.get("content")
+    # if we get a bad response, halt the script
+    # report is sorted by MMS ID, so we can use this to resume later if needed
+    if not alma_bib:
+        # raised in the worker thread, then again in main by future.result()
+        raise FatalAPIError(
+            f"Unexpected response for MMS ID {mms_id}, index {report_index}. Exiting."
+        )
+    # check for error in bib response, usually due to invalid MMS ID;
+    # Alma sends errors with a non-200 status, so the bib itself isn't scanned
+    if bib_response["api_response"]["status_code"] != 200:
+        logging.error(
+            "Got an error finding bib record for MMS ID %s. Skipping this record.",
+            mms_id,
+        )
+        return ERRORED, mms_id
+
+    # convert to Pymarc to handle fields and subfields
+    pymarc_record = get_pymarc_record_from_bib(alma_bib)
+    bib_was_updated = False
+    for field_966 in pymarc_record.get_fields("966"):
+        if try_update_966(field_966, spac_mappings):
+            # reading $a for the message builds a list, so only do it if it's logged
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(
+                    "Updated bookplate. MMS ID: %s, SPAC: %s",
+                    mms_id,
+                    field_966.get_subfields("a")[0],
+                )
+            bib_was_updated = True
+
+    # don't send an update if no 966 has a mapped SPAC, or all are already current
+    if not bib_was_updated:
+        # this case shouldn't happen, since report is limited to records that need updating
+        # log it in case it does
+        logging.info("Skipping MMS ID %s. No 966 updates needed.", mms_id)
+        return SKIPPED, mms_id
+
+    new_alma_bib = prepare_bib_for_update(alma_bib, pymarc_record)
+    try:
+        update_response = call_with_retry(
+            client.update_bib, mms_id, new_alma_bib, rate_limiter=rate_limiter
+        )
+    except RETRY_EXCEPTIONS as e:
+        logging.error("Error updating MMS ID %s: %s", mms_id, e)
+        return ERRORED, mms_id
+    # Alma rejects an update with a non-200 status
+    if update_response["api_response"]["status_code"] != 200:
+        logging.error("Alma rejected the update for MMS ID %s.", mms_id)
+        return ERRORED, mms_id
+    return UPDATED, mms_id
+
+
+def _collect_results(done: set, status_counts: Counter) -> None:
+    """Count the status of each finished bib, logging progress periodically.
+
+    If a bib raised FatalAPIError, the other finished bibs are still counted,
+    then the error is raised again.
+    """
+    fatal_error = None
+    for future in done:
+        try:
+            status, mms_id = future.result()
+        except FatalAPIError as e:
+            fatal_error = e
+            continue
+        status_counts[status] += 1
+        processed_count = sum(status_counts.values())
+        # the report is streamed, so its length isn't known; log at a fixed interval
+        if processed_count % PROGRESS_INTERVAL == 0:
+            logging.info("Processed %d bibs. Last MMS ID: %s", processed_count, mms_id)
+    if fatal_error:
+        raise fatal_error
 
 
 def main():
@@ -91,9 +259,27 @@ def main():
     parser.add_argument(
         "--start-index", type=int, help="Start processing report data at this index"
     )
+    parser.add_argument(
+        "--limit", type=int, help="Process at most this many bibs from the report"
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=DEFAULT_REQUESTS_PER_MINUTE,
+        help="Maximum Alma API requests per minute "
+        f"(default: {DEFAULT_REQUESTS_PER_MINUTE})",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=MAX_WORKERS,
+        help=f"Number of bibs to process concurrently (default: {MAX_WORKERS})",
+    )
     args = parser.parse_args()
+    if args.rpm < 1:
+        parser.error("--rpm must be at least 1")
 
-    logging.basicConfig(filename="update_bookplates_one_time.log", level=args.log_level)
+    configure_logging("update_bookplates_one_time.log", args.log_level)
     # always suppress urllib3 logs with lower level than WARNING
     logging.getLogger("urllib3").setLevel(logging.WARNING)
 
@@ -116,79 +302,81 @@ def main():
         alma_api_key = API_KEYS["DIIT_SCRIPTS"]
         report = get_mms_report(analytics_api_key)
 
-    # if a start index is provided, slice the report to start at that index
-    if args.start_index:
-        report = report[args.start_index :]
+    start_index = args.start_index or 0
+    # if a start index or limit is provided, take that part of the report lazily,
+    # without copying it
+    if args.start_index or args.limit:
+        stop_index = start_index + args.limit if args.limit else None
+        report = islice(report, start_index, stop_index)
 
-    logging.info(f"Beginning processing {len(report)} bib e-bookplates")
+    logging.info(
+        "Beginning processing bib e-bookplates at report index %d", start_index
+    )
 
-    client = AlmaAPIClient(alma_api_key)
+    client = AlmaAPIClient(alma_api_key, pool_maxsize=args.max_workers)
 
     spac_mappings = get_spac_mappings(args.spac_mappings_file)
 
-    # initialize counters
-    total_bibs_updated = 0
-    total_bibs_skipped = 0
-    total_bibs_errored = 0
-    report_index = 0
-
-    for item in report:
-
-        mms_id = item["MMS Id"]
-        bib_was_updated = False
-
-        # get bib from Alma
-        alma_bib = client.get_bib(mms_id).get("content")
-        # check for error in bib response, usually due to invalid MMS ID
-        if b"errorsExist" in alma_bib:
-            logging.error(
-                f"Got an error finding bib record for MMS ID {mms_id}. Skipping this record."
-            )
-            total_bibs_errored += 1
-            continue
-        # if we get a bad response, halt the script
-        # report is sorted by MMS ID, so we can use this to resume later if needed
-        if not alma_bib:
-            logging.error(
-                f"Unexpected response for MMS ID {mms_id}, index {report_index}. Exiting."
-            )
-            exit()
-
-        # convert to Pymarc to handle fields and subfields
-        pymarc_record = get_pymarc_record_from_bib(alma_bib)
-        for field_966 in pymarc_record.get_fields("966"):
-            if needs_bookplate_update(field_966, spac_mappings):
-                # get the SPAC name and URL from the mappings
-                spac_info = get_spac_info(spac_mappings, field_966)
-                spac_name = spac_info["spac_name"]
-                spac_url = spac_info["spac_url"]
-                update_existing_966(field_966, spac_name, spac_url)
-                logging.debug(
-                    f"Updated bookplate. MMS ID: {mms_id}, SPAC Name: {spac_name}",
+    rate_limiter = get_rate_limiter(args.rpm)
+
+    status_counts = Counter()
+    duplicate_rows_count = 0
+    # a bib listed in the report more than once needs only one GET and PUT
+    seen_mms_ids = set()
+    fatal_error = None
+    # bibs are independent, so their API calls can overlap
+    with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+        pending = set()
+        try:
+            for report_index, item in enumerate(report, start=start_index):
+                mms_id = item["MMS Id"]
+                if mms_id in seen_mms_ids:
+                    logging.debug("Skipping duplicate row for MMS ID %s", mms_id)
+                    duplicate_rows_count += 1
+                    continue
+                seen_mms_ids.add(mms_id)
+                pending.add(
+                    executor.submit(
+                        process_bib,
+                        mms_id,
+                        report_index,
+                        client,
+                        spac_mappings,
+                        rate_limiter,
+                    )
                 )
-                bib_was_updated = True
-
-        if bib_was_updated:
-            new_alma_bib = prepare_bib_for_update(alma_bib, pymarc_record)
-            client.update_bib(mms_id, new_alma_bib)
-            total_bibs_updated += 1
-        else:
-            # this case shouldn't happen, since report is limited to records that need updating
-            # log it in case it does
-            total_bibs_skipped += 1
-            logging.info(f"Skipping MMS ID {mms_id}. No 966 updates needed.")
-
-        report_index += 1
-        # every 1% of records, log progress
-        # Take 1%, round down, add 1 to avoid 0 when length < 100
-        progress_interval = (len(report) // 100) + 1
-        if report_index % progress_interval == 0:
-            logging.info(f"Processed {report_index} bibs. Last MMS ID: {mms_id}")
-
-    logging.info("Finished adding ebookplates.")
-    logging.info(f"{total_bibs_updated} bibs updated.")
-    logging.info(f"{total_bibs_skipped} bibs skipped with no 966 updates needed.")
-    logging.info(f"{total_bibs_errored} bibs skipped due to errors.")
+                # don't queue up the whole report; wait for some bibs to finish
+                if len(pending) >= args.max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect_results(done, status_counts)
+
+            done, pending = wait(pending)
+            _collect_results(done, status_counts)
+        except FatalAPIError as e:
+            # let bibs already being processed finish, but don't start any more
+            executor.shutdown(cancel_futures=True)
+            fatal_error = e
+            # count the bibs which finished, so the summary matches what was sent
+            try:
+                _collect_results(
+                    {future for future in pending if not future.cancelled()},
+                    status_counts,
+                )
+            except FatalAPIError:
+                # already stopping; the first error is the one reported
+                pass
+
+    if fatal_error:
+        logging.error(fatal_error)
+        logging.info("Stopped adding ebookplates.")
+    else:
+        logging.info("Finished adding ebookplates.")
+    logging.info("%d bibs updated.", status_counts[UPDATED])
+    logging.info("%d bibs skipped with no 966 updates needed.", status_counts[SKIPPED])
+    logging.info("%d bibs skipped due to errors.", status_counts[ERRORED])
+    logging.info("%d duplicate report rows skipped.", duplicate_rows_count)
+    if fatal_error:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
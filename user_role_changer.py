@@ -1,7 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
 from csv import DictReader
+from threading import Lock
 import json
 import sys
-from alma_api_client import AlmaAPIClient
+from alma_api_client import (
+    DEFAULT_REQUESTS_PER_MINUTE,
+    RETRY_EXCEPTIONS,
+    AlmaAPIClient,
+    SlidingWindowRateLimiter,
+    call_with_retry,
+    get_rate_limiter,
+)
 from alma_api_keys import API_KEYS
 
 """
@@ -14,81 +23,204 @@ DO NOT USE AS-IS!
 """
 
 
+# Users updated at once; each row is independent, and the time is all spent
+# waiting on Alma.
+MAX_WORKERS = 10
+
+# print() writes the message and the newline separately, so output from
+# different threads can run together unless printing is serialized.
+_print_lock = Lock()
+
+# Roles which users might have which are unexpected,
+# but not a problem for this project.  These have been manually reviewed
+# and confirmed OK.
+_EXTRA_ROLES = (
+    {
+        "status": {"value": "ACTIVE", "desc": "Active"},
+        "scope": {"value": "YRL", "desc": "Young Research Library"},
+        "role_type": {"value": "214", "desc": "Work Order Operator"},
+        "parameter": [
+            {
+                "type": {"value": "ServiceUnit"},
+                "scope": {"value": "YRL", "desc": "Young Research Library"},
+                "value": {
+                    "value": "DEFAULT_CIRC_DESK-Reserves",
+                    "desc": "YRL  Circ Desk",
+                },
+            }
+        ],
+    },
+    {
+        "status": {"value": "ACTIVE", "desc": "Active"},
+        "scope": {"value": "BIOMED", "desc": "Biomed Library"},
+        "role_type": {"value": "214", "desc": "Work Order Operator"},
+        "parameter": [
+            {
+                "type": {"value": "ServiceUnit"},
+                "scope": {"value": "BIOMED", "desc": "Biomed Library"},
+                "value": {"value": "DEFAULT_CIRC_DESK", "desc": ""},
+            }
+        ],
+    },
+    {
+        "status": {"value": "ACTIVE", "desc": "Active"},
+        "scope": {"value": "ARTS", "desc": "Arts Library"},
+        "role_type": {"value": "51", "desc": "Requests Operator"},
+        "parameter": [
+            {
+                "type": {"value": "CirculationDesk"},
+                "scope": {"value": "ARTS", "desc": "Arts Library"},
+                "value": {
+                    "value": "ARTS READ RM",
+                    "desc": "Arts Reading Room for BUO",
+                },
+            },
+            {
+                "type": {"value": "CirculationDesk"},
+                "scope": {"value": "ARTS", "desc": "Arts Library"},
+                "value": {"value": "DEFAULT_CIRC_DESK", "desc": "Arts Circ Desk"},
+            },
+        ],
+    },
+)
+
+
 def main() -> None:
-    # client = AlmaAPIClient(API_KEYS["SANDBOX"])
-    client = AlmaAPIClient(API_KEYS["DIIT_SCRIPTS"])  # Production
+    # client = AlmaAPIClient(API_KEYS["SANDBOX"], pool_maxsize=MAX_WORKERS)
+    # Production
+    client = AlmaAPIClient(API_KEYS["DIIT_SCRIPTS"], pool_maxsize=MAX_WORKERS)
+    # Shared by all threads, so together they stay within Alma's rate limit.
+    rate_limiter = get_rate_limiter(DEFAULT_REQUESTS_PER_MINUTE)
 
     # One time: get profile data from SANDBOX and store it for production use.
     # profiles = get_profiles_from_alma(client)
     # Normal run: get profile data from file.
     profiles = _load_profiles()
+    # Every user is checked against the same profile, so its role keys
+    # are built once instead of for every user.
+    expected_roles = _get_role_keys(profiles["Fulfillment Operator (Student Staff)"])
 
     input_file = sys.argv[1]
     with open(input_file, mode="r") as f:
         dict_reader = DictReader(f, delimiter="\t")
-        users_to_change = list(dict_reader)
-        for row in users_to_change:
-            # Relevant data only, trimmed and tweaked as needed.
-            # full_name = row["Full Name"].strip()
-            # Fix Excel-mangled UIDs... left-pad with 0 to length of 9 characters
-            primary_id = row["Primary Identifier"].strip().rjust(9, "0")
-            target_profile = row["Target Profile"].strip()
-
-            # Not all users should be updated; some don't have a profile assigned.
-            if target_profile in profiles.keys():
-                user = client.get_user(primary_id)
-                if user.get("errorsExist"):
-                    # QAD, but this should exist in this case
-                    error_message = (
-                        user.get("errorList").get("error")[0].get("errorMessage")
-                    )
-                    print(f"ERROR: Skipping {primary_id}: {error_message}")
-                    continue
-
-                # User exists, no errors, onward!
-                # We use a shorter job category for this than the full profile name.
-                job_category = user.get("job_category").get("value")
-                if job_category != "Fulfillment Operator (Student)":
-                    print(
-                        f"ERROR: Skipping {primary_id}: job category '{job_category}' mismatch."
-                    )
-                    continue
-
-                # All is probably OK
-                # Sanity check: does user have the expected roles?
-                # Yes, the user_role key is singular...
-                current_roles = user.get("user_role")
-                expected_roles = profiles.get("Fulfillment Operator (Student Staff)")
-                if _profiles_match(current_roles, expected_roles):
-                    # Proceed with update
-                    # Remove api_response we embed
-                    del user["api_response"]
-                    # Replace the roles with the ones from the target profile
-                    user["user_role"] = profiles.get(target_profile)
-                    # Update the job category; value is enough, but be complete.
-                    user["job_category"] = {
-                        "desc": target_profile,
-                        "value": target_profile,
-                    }
-                    # Finally, update the user in Alma.  This requires an override parameter,
-                    # since job_category is normally protected.
-                    print(f"Updating roles for {primary_id} to {target_profile}...")
-                    params = {"override": "job_category"}
-                    response = client.update_user(primary_id, user, params)
-                    if response.get("errorsExist"):
-                        # QAD, but this should exist in this case
-                        error_message = (
-                            response.get("errorList")
-                            .get("error")[0]
-                            .get("errorMessage")
-                        )
-                        print(f"ERROR: Update failed for {primary_id}: {error_message}")
-                else:
-                    print(
-                        f"ERROR: Skipping {primary_id}: current roles do not match expectations"
-                    )
-            else:
-                print(f"Skipping {primary_id} - unexpected profile '{target_profile}'")
+        users_to_change = _remove_duplicate_users(dict_reader, profiles)
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(
+                process_row, row, client, profiles, expected_roles, rate_limiter
+            )
+            for row in users_to_change
+        ]
+        # Re-raise any unexpected error from a row, as the serial loop did.
+        for future in futures:
+            future.result()
+
+
+def process_row(
+    row: dict,
+    client: AlmaAPIClient,
+    profiles: dict,
+    expected_roles: frozenset,
+    rate_limiter: SlidingWindowRateLimiter,
+) -> None:
+    # Relevant data only, trimmed and tweaked as needed.
+    # full_name = row["Full Name"].strip()
+    primary_id = _get_primary_id(row)
+    target_profile = row["Target Profile"].strip()
+
+    # Not all users should be updated; some don't have a profile assigned.
+    if target_profile in profiles:
+        target_roles = profiles[target_profile]
+        try:
+            user = call_with_retry(
+                client.get_user, primary_id, rate_limiter=rate_limiter
+            )
+        except RETRY_EXCEPTIONS as e:
+            _print(f"ERROR: Skipping {primary_id}: {e}")
+            return
+        if user.get("errorsExist"):
+            # QAD, but this should exist in this case
+            error_message = user.get("errorList").get("error")[0].get("errorMessage")
+            _print(f"ERROR: Skipping {primary_id}: {error_message}")
+            return
+
+        # User exists, no errors, onward!
+        # We use a shorter job category for this than the full profile name.
+        job_category = user.get("job_category").get("value")
+        if job_category != "Fulfillment Operator (Student)":
+            _print(
+                f"ERROR: Skipping {primary_id}: job category '{job_category}' mismatch."
+            )
+            return
+
+        # All is probably OK
+        # Sanity check: does user have the expected roles?
+        # Yes, the user_role key is singular...
+        current_roles = user.get("user_role")
+        if _profiles_match(primary_id, current_roles, expected_roles):
+            # Proceed with update
+            # Remove api_response we embed
+            del user["api_response"]
+            # Replace the roles with the ones from the target profile
+            user["user_role"] = target_roles
+            # Update the job category; value is enough, but be complete.
+            user["job_category"] = {
+                "desc": target_profile,
+                "value": target_profile,
+            }
+            # Finally, update the user in Alma.  This requires an override parameter,
+            # since job_category is normally protected.
+            _print(f"Updating roles for {primary_id} to {target_profile}...")
+            params = {"override": "job_category"}
+            try:
+                response = call_with_retry(
+                    client.update_user,
+                    primary_id,
+                    user,
+                    params,
+                    rate_limiter=rate_limiter,
+                )
+            except RETRY_EXCEPTIONS as e:
+                _print(f"ERROR: Update failed for {primary_id}: {e}")
+                return
+            if response.get("errorsExist"):
+                # QAD, but this should exist in this case
+                error_message = (
+                    response.get("errorList").get("error")[0].get("errorMessage")
+                )
+                _print(f"ERROR: Update failed for {primary_id}: {error_message}")
+        else:
+            _print(
+                f"ERROR: Skipping {primary_id}: current roles do not match expectations"
+            )
+    else:
+        _print(f"Skipping {primary_id} - unexpected profile '{target_profile}'")
+
+
+def _get_primary_id(row: dict) -> str:
+    # Fix Excel-mangled UIDs... left-pad with 0 to length of 9 characters
+    return row["Primary Identifier"].strip().rjust(9, "0")
+
+
+def _remove_duplicate_users(rows: DictReader, profiles: dict) -> list:
+    # Keep only the first row for each user which can be processed.  Later rows
+    # for the same user would fetch the user again, only to find the roles
+    # already changed.  Rows without a known target profile are kept as-is;
+    # they are skipped later, and don't stop a valid row for the same user.
+    primary_ids = set()
+    unique_rows = []
+    for row in rows:
+        if row["Target Profile"].strip() not in profiles:
+            unique_rows.append(row)
+            continue
+        primary_id = _get_primary_id(row)
+        if primary_id in primary_ids:
+            print(f"Skipping {primary_id} - duplicate row")
+            continue
+        primary_ids.add(primary_id)
+        unique_rows.append(row)
+    return unique_rows
 
 
 def get_profiles_from_alma(client: AlmaAPIClient) -> dict:
@@ -140,7 +272,7 @@ def _load_profiles() -> dict:
     file = "ff_profiles.dict"
     # Will fail if file not found, which is good: something went wrong.
     with open(file, "r") as f:
-        profiles = json.loads(f.read())
+        profiles = json.load(f)
         print(f"Loaded profiles: {len(profiles)}")
     return profiles
 
@@ -150,100 +282,58 @@ def _store_profiles(profiles: dict) -> None:
     # Filename is constant.
     file = "ff_profiles.dict"
     with open(file, "w") as f:
-        f.write(json.dumps(profiles))
+        json.dump(profiles, f)
         print(f"Stored profiles: {len(profiles)}")
 
 
-def _profiles_match(current_profile: list, expected_profile: list) -> bool:
+def _get_role_keys(profile: list) -> frozenset:
+    # Profile is a list of dicts.
+    # The combination of each dict's role_type and scope is unique,
+    # so a set of those combinations identifies the profile's roles.
+    return frozenset(d["scope"]["value"] + d["role_type"]["value"] for d in profile)
+
+
+def _profiles_match(
+    primary_id: str, current_profile: list, expected_roles: frozenset
+) -> bool:
     # Profile is a list of dicts.
     # The combination of each dict's role_type and scope is unique.
 
-    # Currently, expected_profle will have 57 roles.
+    # Currently, expected_roles will have 57 roles.
     # At some time in the past, apparently a few unwanted roles were removed;
     # some users still have those roles, in current_profile.
     # Hacky fix to allow this project to proceed....
     if len(current_profile) in range(58, 61):  # 58-60
         # Remove the extra roles
         try:
-            for extra_role in _get_extra_roles():
+            for extra_role in _EXTRA_ROLES:
                 current_profile.remove(extra_role)
         except ValueError:
             # It's OK if the user doesn't have some of these extra roles.
             pass
 
-    current_roles = sorted(
-        [d["scope"]["value"] + d["role_type"]["value"] for d in current_profile]
-    )
-    expected_roles = sorted(
-        [d["scope"]["value"] + d["role_type"]["value"] for d in expected_profile]
-    )
+    # Since each combination is unique, sets can be compared without sorting.
+    current_roles = _get_role_keys(current_profile)
     # If the profiles still don't match, output a little info if similar, for debugging.
     # Otherwise, just punt.
     if current_roles != expected_roles:
         cp_len = len(current_profile)
-        ep_len = len(expected_profile)
-        print(f"ERROR: Current profile has {cp_len} role(s), expected {ep_len}")
+        ep_len = len(expected_roles)
+        _print(
+            f"ERROR: {primary_id}: Current profile has {cp_len} role(s), "
+            f"expected {ep_len}"
+        )
         if abs(cp_len - ep_len) <= 2:
             for role in current_profile:
-                if role not in expected_profile:
-                    print(f"{role} missing from expected_profile")
+                role_key = role["scope"]["value"] + role["role_type"]["value"]
+                if role_key not in expected_roles:
+                    _print(f"{primary_id}: {role} missing from expected_profile")
     return current_roles == expected_roles
 
 
-def _get_extra_roles() -> list:
-    # Return list of roles which users might have which are unexpected,
-    # but not a problem for this project.  These have been manually reviewed
-    # and confirmed OK.
-    extra_roles = [
-        {
-            "status": {"value": "ACTIVE", "desc": "Active"},
-            "scope": {"value": "YRL", "desc": "Young Research Library"},
-            "role_type": {"value": "214", "desc": "Work Order Operator"},
-            "parameter": [
-                {
-                    "type": {"value": "ServiceUnit"},
-                    "scope": {"value": "YRL", "desc": "Young Research Library"},
-                    "value": {
-                        "value": "DEFAULT_CIRC_DESK-Reserves",
-                        "desc": "YRL  Circ Desk",
-                    },
-                }
-            ],
-        },
-        {
-            "status": {"value": "ACTIVE", "desc": "Active"},
-            "scope": {"value": "BIOMED", "desc": "Biomed Library"},
-            "role_type": {"value": "214", "desc": "Work Order Operator"},
-            "parameter": [
-                {
-                    "type": {"value": "ServiceUnit"},
-                    "scope": {"value": "BIOMED", "desc": "Biomed Library"},
-                    "value": {"value": "DEFAULT_CIRC_DESK", "desc": ""},
-                }
-            ],
-        },
-        {
-            "status": {"value": "ACTIVE", "desc": "Active"},
-            "scope": {"value": "ARTS", "desc": "Arts Library"},
-            "role_type": {"value": "51", "desc": "Requests Operator"},
-            "parameter": [
-                {
-                    "type": {"value": "CirculationDesk"},
-                    "scope": {"value": "ARTS", "desc": "Arts Library"},
-                    "value": {
-                        "value": "ARTS READ RM",
-                        "desc": "Arts Reading Room for BUO",
-                    },
-                },
-                {
-                    "type": {"value": "CirculationDesk"},
-                    "scope": {"value": "ARTS", "desc": "Arts Library"},
-                    "value": {"value": "DEFAULT_CIRC_DESK", "desc": "Arts Circ Desk"},
-                },
-            ],
-        },
-    ]
-    return extra_roles
+def _print(message: str) -> None:
+    with _print_lock:
+        print(message)
 
 
 if __name__ == "__main__":